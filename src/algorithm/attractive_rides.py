@@ -1,40 +1,212 @@
 """ Script with main ExMAS calculations """
 from logging import Logger
+from typing import Iterator
 
+import numpy as np
 import pandas as pd
 
-from algorithm.feasibility_utils.miscellaneous import maximum_delay, ride_output_columns
+from algorithm.feasibility_utils.miscellaneous import maximum_delay
 from algorithm.feasibility_utils.singles import single_rides
+from algorithm.feasibility_utils.request_table import RequestTable
 from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
 from algorithm.feasibility_utils.pairs import pair_pool
+from algorithm.feasibility_utils.high_order_rides_v02 import extend_feasible_rides
+from algorithm.feasibility_utils.pruning import prune_rides
+from algorithm.result_cache import ResultCache, result_key
 
 
 def attractive_rides(
         requests: pd.DataFrame,
-        skim_matrix: pd.DataFrame,
+        skim_matrix: Skim,
         parameters: dict,
         travellers_characteristics: dict | None = None,
-        logger: Logger | None = None
-):
+        logger: Logger | None = None,
+        metrics: Metrics | None = None,
+        cache: ResultCache | None = None
+) -> pd.DataFrame:
     """
     The main function of the ExMAS algorithm
     :param requests: request dataframe. The dataframe must contain
     the following columns: origin, destination, request_time
     optionally it can include passenger id for identification purposes;
     the key word is "traveller_id".
-    :param skim_matrix: matrix with distances between nodes
+    :param skim_matrix: skim with distances between nodes
     :param parameters: params required in the process
-    those include: speed, price, share_discount, horizon
+    those include: speed, price, share_discount, horizon,
+    optionally frontier_pruning (see prune_rides), dist_threshold
+    (maximal distance between origins and between destinations of a pair)
+    and spatial_landmarks (number of landmarks of the pair prefilter and of
+    bounds of higher degrees, see spatially_compatible and within_bounds, 0 to disable)
     :param travellers_characteristics: dictionary with individual
     traits of travellers. Passed optionally. If passed, the passenger
     id must be passed in the request file and must coincide with the
     passed dictionary, the key word is "traveller_id".
     :param logger: if you want to receive log, pass a Logger
+    :param metrics: if passed, collects timings, memory and
+    numbers of candidates after each filter of consecutive stages
+    :param cache: if passed, rides are read from and stored in the cache,
+    rides of lower degrees are reused when only max_degree increases
     :return: dictionary with ride-pooling system estimates
     mainly: shareability graph ('feasible_rides') and schedule
     for the optimal performance ('schedule')
     """
+    return shareability_output(shareability_rides(
+        requests=requests,
+        skim_matrix=skim_matrix,
+        parameters=parameters,
+        travellers_characteristics=travellers_characteristics,
+        logger=logger,
+        metrics=metrics,
+        cache=cache
+    ))
+
+
+def shareability_rides(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None,
+        cache: ResultCache | None = None
+) -> dict:
+    """
+    Attractive rides of consecutive degrees, see attractive_rides
+    :return: dictionary degree -> RideTable
+    """
+    return dict(ride_degrees(
+        requests=requests,
+        skim_matrix=skim_matrix,
+        parameters=parameters,
+        travellers_characteristics=travellers_characteristics,
+        logger=logger,
+        metrics=metrics,
+        cache=cache
+    ))
+
+
+def ride_degrees(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None,
+        cache: ResultCache | None = None
+) -> Iterator[tuple]:
+    """
+    Attractive rides of consecutive degrees (see attractive_rides),
+    each degree yielded as soon as it is final. Apart from the yielded
+    rides, only the frontier of the last degree is kept for the extension.
+    :return: generator of (degree, RideTable)
+    """
+    metrics = Metrics() if metrics is None else metrics
+
+    # Rides of lower degrees possibly read from cache
+    cached = {}
+    if cache is not None:
+        key = result_key(requests, skim_matrix, parameters, travellers_characteristics)
+        cached, complete = cache.load(
+            key=key,
+            max_degree=parameters['max_degree'],
+            # Pruned rides are not a valid frontier, unless nothing is pruned
+            resume=parameters.get('frontier_pruning', 'strict') == 'strict'
+        )
+        if complete:
+            yield from cached.items()
+            return
+
+    with metrics.stage('preprocessing'):
+        requests = prepare_requests(
+            requests=requests,
+            skim_matrix=skim_matrix,
+            parameters=parameters,
+            travellers_characteristics=travellers_characteristics,
+            logger=logger
+        )
+        # Typed columns of requests, gathered by traveller position in later stages
+        request_table = RequestTable.from_requests(requests)
+
+    # Start with single rides
+    if 1 in cached:
+        rides = cached.pop(1)
+    else:
+        with metrics.stage('single_rides'):
+            rides = single_rides(requests)
+        optional_log(20, "Single rides computed", logger)
+    if cache is not None:
+        cache.store_degree(key, 1, rides)
+    yield 1, rides
+
+    current_degree = 1
+    if parameters['max_degree'] > 1:
+        # Proceed to rides of degree 2
+        if 2 in cached:
+            rides = cached.pop(2)
+        else:
+            rides = pair_pool(
+                requests=request_table,
+                params=parameters,
+                skim_matrix=skim_matrix,
+                logger=logger,
+                metrics=metrics
+            )
+            optional_log(20, "Feasible Pairs computed", logger)
+        current_degree = 2
+
+    # Extend rides as long as there are attractive extensions,
+    # rides of each degree are pruned first (see prune_rides)
+    while current_degree > 1:
+        with metrics.stage('pruning'):
+            rides, frontier = prune_rides(
+                rides=rides,
+                mode=parameters.get('frontier_pruning', 'strict'),
+                extend=current_degree < parameters['max_degree']
+            )
+        metrics.count('pruning', f'degree_{current_degree}_reported', len(rides))
+        metrics.count('pruning', f'degree_{current_degree}_frontier', len(frontier), logger)
+        if cache is not None:
+            cache.store_degree(key, current_degree, rides)
+        yield current_degree, rides
 
+        if current_degree == parameters['max_degree'] or not len(frontier):
+            break
+        if current_degree + 1 in cached:
+            current_degree += 1
+            rides = cached.pop(current_degree)
+            continue
+        with metrics.stage(f'degree_{current_degree + 1}'):
+            rides = extend_feasible_rides(
+                feasible_rides=frontier,
+                requests=request_table,
+                params=parameters,
+                skim_matrix=skim_matrix,
+                logger=logger,
+                metrics=metrics
+            )
+        if not len(rides):
+            break
+        current_degree += 1
+        optional_log(20, f"Feasible rides of degree {current_degree} computed", logger)
+
+    if cache is not None:
+        cache.complete(key, list(range(1, current_degree + 1)), parameters['max_degree'])
+
+
+def prepare_requests(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None
+) -> pd.DataFrame:
+    """
+    Compute characteristics of requests and their private rides
+    (distance, t_req_int, t_ns, u_ns, max_delay), see attractive_rides
+    :return: requests sorted by t_req_int
+    """
     # Incorporate individual characteristics if passed
     individual_characteristics = ['VoT', 'WtS']
     if travellers_characteristics is not None:
@@ -57,24 +229,20 @@ def attractive_rides(
         optional_log(0, "travelled_id not specified, defaults", logger)
         requests['traveller_id'] = list(range(1, len(requests) + 1))
 
-    # Compute trip characteristics
-    requests['distance'] = requests.apply(
-        lambda x: skim_matrix.loc[x['origin'], x['destination']],
-        axis=1
-    )
-    requests['request_time'] = requests['request_time'].apply(pd.to_datetime, format='%Y-%m-%d %H:%M:%S')
-    requests['t_req_int'] = requests.apply(
-        lambda x: (x['request_time'] - min(requests['request_time'])).seconds,
-        axis=1
-    )
+    # Compute trip characteristics, column-wise
+    requests['distance'] = skim_matrix[
+        requests['origin'].to_numpy(), requests['destination'].to_numpy()
+    ]
+    requests['request_time'] = pd.to_datetime(requests['request_time'], format='%Y-%m-%d %H:%M:%S')
+    requests['t_req_int'] = (requests['request_time'] - requests['request_time'].min()) \
+        .dt.seconds.astype(np.int64)
     requests.sort_values('t_req_int', inplace=True)
 
     # Compute basic characteristics for the private rides
-    requests['t_ns'] = requests['distance'].apply(lambda x: int(x / parameters["speed"]))
-    requests['u_ns'] = requests.apply(
-        lambda x: -parameters['price'] * x['distance'] / 1000 + x['VoT'] * x['t_ns'],
-        axis=1
-    )
+    distance = requests['distance'].to_numpy()
+    requests['t_ns'] = np.trunc(distance / parameters['speed']).astype(np.int64)
+    requests['u_ns'] = -parameters['price'] * distance / 1000 - \
+        requests['VoT'].to_numpy() * requests['t_ns'].to_numpy()
 
     # Maximum possible delay of a trip, using travellers perspective
     requests['max_delay'] = maximum_delay(
@@ -86,42 +254,12 @@ def attractive_rides(
     if 'ASC_pool' not in requests.columns:
         requests['ASC_pool'] = 0
 
-    # Initialise a shareability graph (dataframe with feasible rides)
-    feasible_rides = pd.DataFrame(
-        columns=ride_output_columns()
-    )
-
-    # Start with single rides
-    feasible_rides = pd.concat(
-        [feasible_rides,
-         single_rides(requests)]
-    )
-
-    optional_log(20, "Single rides computed", logger)
-
-    if parameters['max_degree'] == 1:
-        return feasible_rides
-
-    # Proceed to rides of degree 2
-    feasible_rides = pd.concat(
-        [feasible_rides,
-         pair_pool(
-             requests=requests,
-             params=parameters,
-             skim_matrix=skim_matrix,
-             logger=logger
-         )]
-    )
-
-    optional_log(20, "Feasible Pairs computed", logger)
-
-    if parameters['max_degree'] == 2:
-        return feasible_rides
-
-    current_degree = 2
-    while current_degree < parameters['max_degree']:
-        potential_extension = 0
-
+    return requests
 
-    return feasible_rides
 
+def shareability_output(
+        rides_by_degree: dict
+) -> pd.DataFrame:
+    """ Convert rides of all degrees to the ride_output_columns() dataframe """
+    return pd.concat([rides.to_dataframe() for rides in rides_by_degree.values()],
+                     ignore_index=True)
@@ -1,140 +1,538 @@
 """ Search for feasible extensions """
-from collections import Counter
-from itertools import product
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
 from logging import Logger
 
-import pandas as pd
 import numpy as np
+import pandas as pd
+
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
+from utilities.shared_arrays import SharedArrays, attach_shared_arrays
+from algorithm.feasibility_utils.utility_functions import shared_utilities
+from algorithm.feasibility_utils.kernels import select_kernels
+from algorithm.feasibility_utils.pooltype import PoolType
+from algorithm.feasibility_utils.pruning import unique_signatures
+from algorithm.feasibility_utils.request_table import RequestTable
+from algorithm.feasibility_utils.ride_table import RideTable
+from algorithm.feasibility_utils.spatial import landmark_embedding, route_bounds
 
-from utilities.general_utils import optional_log, calculate_distance
-from algorithm.feasibility_utils.utility_functions import utility_shared
-from algorithm.feasibility_utils.miscellaneous import ride_output_columns
+_WORKER = {}
 
 
 def extend_feasible_rides(
-        feasible_rides: pd.DataFrame,
-        requests: pd.DataFrame,
+        feasible_rides: RideTable,
+        requests: pd.DataFrame | RequestTable,
         params: dict,
-        skim_matrix: pd.DataFrame,
-        logger: Logger | None
-) -> pd.DataFrame:
+        skim_matrix: Skim,
+        logger: Logger | None,
+        metrics: Metrics | None = None
+) -> RideTable:
     """
     Extend feasible rides of degree 2 or more
     accounting for their attractiveness
-    :param feasible_rides: dataframe with current feasible rides
+    :param feasible_rides: feasible rides of the current (maximal) degree
     :param requests: original requests
-    :param params: parameters of the simulation
+    :param params: parameters of the simulation, with 'processes' > 1
+    the extension is sharded across a pool of processes
     :param skim_matrix: distances within the city
     :param logger: for logging purposes
-    :return: extended list of rides with their characteristics
-    and information whether the extension was successful
-    (can be further propagated) or is to be terminated
+    :param metrics: collects numbers of candidates after each filter
+    :return: attractive rides of degree one higher (empty
+    table if the extension is to be terminated)
     """
-    # obtain the latest extension, i.e. maximum degree
-    current_degree = max(feasible_rides['indexes'].apply(
-        lambda x: len(x)
-    ))
+    metrics = Metrics() if metrics is None else metrics
+    requests = RequestTable.from_requests(requests)
+    current_degree = feasible_rides.degree
 
-    is_max_degree = feasible_rides['index'].apply(
-        lambda x: len(x) == current_degree
-    )
+    optional_log(20, f'Initial number of rides of degree {current_degree} '
+                     f'is {len(feasible_rides)}', logger)
+
+    if params.get('processes', 1) > 1:
+        extended = _extend_in_parallel(feasible_rides, requests, params, skim_matrix, metrics)
+    else:
+        origins, destinations = candidate_extensions(feasible_rides)
+        optional_log(20, f'Number of feasible extensions of degree {current_degree}'
+                         f' is {len(origins)}', logger)
+        extended = evaluate_rides(
+            origin_order=origins,
+            destination_order=destinations,
+            requests=requests,
+            params=params,
+            skim_matrix=skim_matrix,
+            metrics=metrics
+        )
+
+    return unique_signatures(extended)
+
+
+def _extend_in_parallel(
+        feasible_rides: RideTable,
+        requests: RequestTable,
+        params: dict,
+        skim_matrix: Skim,
+        metrics: Metrics
+) -> RideTable:
+    """
+    Shard the groups of rides (see candidate_extensions) across processes.
+    The skim (restricted to the demand nodes), request columns and the
+    rides to extend are placed in shared memory, workers attach to them.
+    Counts of candidates are collected by the workers and merged.
+    """
+    skim = skim_matrix.subset(np.concatenate([requests.origin, requests.destination]))
+    arrays = {'skim': skim.matrix, 'skim_nodes': skim.nodes,
+              'ids': feasible_rides.ids,
+              'origin_order': feasible_rides.origin_order,
+              'destination_order': feasible_rides.destination_order}
+    arrays.update({'request_' + col: values for col, values in requests.to_dict().items()})
+    shards = 4 * params['processes']
 
-    rides_to_extend = feasible_rides.loc[is_max_degree].copy()
+    with SharedArrays(arrays) as shared, \
+            ProcessPoolExecutor(max_workers=params['processes'], initializer=_initialise_worker,
+                                initargs=(shared.specs, params)) as executor:
+        results = list(executor.map(_extend_shard, range(shards), [shards] * shards))
 
-    optional_log(20, f'Initial number of rides of degree {current_degree}'
-                     f'is {len(rides_to_extend)}', logger)
+    for _, counts in results:
+        metrics.merge_counts(counts)
+    return RideTable.concat([table for table, _ in results])
 
-    # Move to feasible extensions
-    combinations = rides_to_extend.apply(
-        lambda row: (row['indexes'], row['origin_order'], row['dest_order']),
-        axis=1
+
+def _initialise_worker(
+        specs: dict,
+        params: dict
+) -> None:
+    """ Attach to the shared arrays once per worker """
+    arrays, _WORKER['blocks'] = attach_shared_arrays(specs)
+    _WORKER['skim'] = Skim(arrays['skim'], arrays['skim_nodes'])
+    _WORKER['requests'] = RequestTable(
+        **{name[len('request_'):]: values for name, values in arrays.items()
+           if name.startswith('request_')})
+    _WORKER['rides'] = RideTable(
+        ids=arrays['ids'],
+        origin_order=arrays['origin_order'],
+        destination_order=arrays['destination_order'],
+        delays=np.zeros(arrays['ids'].shape),
+        u_traveller_individual=np.zeros(arrays['ids'].shape),
+        kind=0,
+        veh_distance=np.zeros(len(arrays['ids'])),
+        t_travel=np.zeros(len(arrays['ids']))
+    )
+    _WORKER['params'] = params
+
+
+def _extend_shard(
+        shard: int,
+        shards: int
+) -> (RideTable, dict):
+    """ Extension and evaluation of a single shard in a worker """
+    if 'index' not in _WORKER:
+        _WORKER['index'] = frontier_index(_WORKER['rides'])
+    origins, destinations = candidate_extensions(_WORKER['rides'], shard, shards, _WORKER['index'])
+    metrics = Metrics()
+    extended = evaluate_rides(
+        origin_order=origins,
+        destination_order=destinations,
+        requests=_WORKER['requests'],
+        params=_WORKER['params'],
+        skim_matrix=_WORKER['skim'],
+        metrics=metrics
     )
+    return extended, metrics.counts
+
+
+def frontier_index(
+        feasible_rides: RideTable
+) -> (np.ndarray, set, dict):
+    """
+    Index of rides of degree k used to extend them
+    :param feasible_rides: feasible rides of degree k
+    :return: sorted signatures (origin order, destination order) of the rides
+    (see _row_keys), pairs of travellers sharing a ride and groups of rides
+    by their sub-ride without the largest member
+    """
+    degree = feasible_rides.degree
+    signatures = ride_signatures(feasible_rides)
+    adjacency = set()
+    for i, j in combinations(range(degree), 2):
+        adjacency.update(zip(np.minimum(feasible_rides.ids[:, i], feasible_rides.ids[:, j]).tolist(),
+                             np.maximum(feasible_rides.ids[:, i], feasible_rides.ids[:, j]).tolist()))
+
+    groups = defaultdict(list)
+    for origin, destination in set(zip(map(tuple, feasible_rides.origin_order.tolist()),
+                                       map(tuple, feasible_rides.destination_order.tolist()))):
+        top = max(origin)
+        groups[(_without(origin, top), _without(destination, top))].append(
+            (top, origin.index(top), destination.index(top)))
+
+    return signatures, adjacency, groups
+
+
+def ride_signatures(
+        rides: RideTable
+) -> np.ndarray:
+    """ Sorted signatures (origin order, destination order) of rides, see _row_keys """
+    return np.unique(_row_keys(np.hstack([rides.origin_order, rides.destination_order])))
 
-    def _compatible_func(_comb1, _comb2, _deg):
-        _common = [t for t in _comb2[0] if t in _comb1[0]]
-        if len(_common) != _deg - 1:
-            return []
-        if [t for t in _comb1[1] if t in _common] != [t for t in _comb2[1] if t in _common]:
-            return []
-        if [t for t in _comb1[2] if t in _common] != [t for t in _comb2[2] if t in _common]:
-            return []
-        _new_sec = [t for t in _comb2[0] if t not in _common]
-        return np.prod([_comb1[1].insert(_comb2[1].index(_new_sec), _new_sec),
-                        _comb1[1].insert(_comb2[1].index(_new_sec) + 1, _new_sec)],
-                       [_comb1[2].insert(_comb2[2].index(_new_sec), _new_sec),
-                        _comb1[2].insert(_comb2[2].index(_new_sec) + 1, _new_sec)])
-
-    all_od_pairs = [_compatible_func(c1, c2, current_degree) for c1, c2 in product(combinations, combinations)]
-    all_od_pairs = [a for b in all_od_pairs for a in b if b]
-    counted_od_pairs = Counter(all_od_pairs)
-    candidate_combinations = [k for k, v in counted_od_pairs.items() if v >= current_degree]
-
-    optional_log(20, f'Number of feasible extensions of degree {current_degree}'
-                     f' is {len(candidate_combinations)}', logger)
-
-    if not candidate_combinations:
-        return pd.DataFrame()
-
-    feasible_combinations = {}
-
-    for extension in candidate_combinations:
-        private_chars = {
-            t: {
-                char: requests.loc[t, char]
-                for char in ['distance', 'VoT', 'WtS', 'u_ns', 'ASC_pool']
-            } for t in extension[0],
-        }
-        ind_dist = {
-            t: calculate_distance(skim=skim_matrix,
-                                  list_points=[requests.loc[t, 'origin'] for t in
-                                               extension[0][extension[0].index(t):]] +
-                                              [requests.loc[t, 'destination'] for t in
-                                               extension[1][:(1 + extension[1].index(t))]]
-                                  )
-            for t in extension[0]
-        }
-
-        # First, calculate delays
-        start_time = requests.loc[extension[0][0], 't_req_int']
-        initial_delays = [requests.loc[t, 't_req_int'] - start_time for t in extension[0]]
-        optimal_delay = -sum(initial_delays) / len(initial_delays)
-        delays = [abs(t + optimal_delay) for t in initial_delays]
-
-        # Now, utility
-        shared_utilities = {
-            t: utility_shared(
-                distance=ind_dist[t]['distance'],
-                vot=private_chars[t]['VoT'],
-                wts=private_chars[t]['WtS'],
-                price=params['price'],
-                discount=params['share_discount'],
-                delay=delays[num],
-                delay_value=params['delay_value'],
-                asc_pool=private_chars[t]['ASC_pool'],
-                avg_speed=params['speed']
-            ) for num, t in enumerate(extension[0])
-        }
-
-        if any([shared_utilities[key] < private_chars[key]['u_ns']
-                for key in private_chars.keys()]):
+
+def candidate_extensions(
+        feasible_rides: RideTable,
+        shard: int = 0,
+        shards: int = 1,
+        index: tuple | None = None
+) -> (np.ndarray, np.ndarray):
+    """
+    Enumerate rides of degree k+1 all of whose sub-rides of degree k
+    (with origin and destination orders restricted accordingly)
+    are feasible. A ride of degree k+1 with the two largest members a < b
+    is built exactly once: from the sub-rides without b and without a,
+    which share the same sub-ride of degree k-1 when their largest
+    member is removed. The rides are grouped by that sub-ride, so
+    only rides sharing it are combined; a and b must already travel
+    together in some ride of degree k (pair adjacency) and
+    the remaining sub-rides are confirmed by a vectorized lookup.
+    :param feasible_rides: feasible rides of degree k
+    :param shard: with shards > 1, only groups in the given shard are extended
+    :param shards: number of shards
+    :param index: frontier_index of the rides, computed if not passed
+    :return: origin and destination orders of candidates (n x k+1)
+    """
+    degree = feasible_rides.degree
+    signatures, adjacency, groups = frontier_index(feasible_rides) if index is None else index
+
+    candidates = []
+    for (common_origin, common_destination), members in groups.items():
+        # Hash of a tuple of integers is the same in every process
+        if shards > 1 and hash((common_origin, common_destination)) % shards != shard:
             continue
+        for (first, first_o, first_d), (second, second_o, second_d) in \
+                combinations(sorted(members), 2):
+            if first == second or (first, second) not in adjacency:
+                continue
+            for origin in _merge(common_origin, first, first_o, second, second_o):
+                for destination in _merge(common_destination, first, first_d, second, second_d):
+                    candidates.append(origin + destination)
+
+    if not candidates:
+        return np.empty((0, degree + 1), dtype=int), np.empty((0, degree + 1), dtype=int)
+
+    candidates = np.array(candidates, dtype=np.int64)
+    origins, destinations = candidates[:, :degree + 1], candidates[:, degree + 1:]
+
+    # Sub-rides without a member of the common sub-ride (smaller than the two largest)
+    feasible = sub_rides_within(
+        signatures=signatures,
+        origins=origins,
+        destinations=destinations,
+        checked=origins < np.sort(origins, axis=1)[:, -2:-1]
+    )
+    return origins[feasible], destinations[feasible]
+
+
+def sub_rides_within(
+        signatures: np.ndarray,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        checked: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Whether sub-rides of rides of degree k+1, without one of the members,
+    are among the signatures of rides of degree k
+    :param signatures: sorted signatures, see ride_signatures
+    :param origins: origin orders of rides of degree k+1
+    :param destinations: destination orders of rides of degree k+1
+    :param checked: which members (positions in origins) to remove, all by default
+    :return: boolean mask of rides all of whose checked sub-rides are in signatures
+    """
+    found = sub_ride_positions(signatures, origins, destinations) >= 0
+    if checked is not None:
+        found |= ~checked
+    return found.all(axis=1)
 
-        feasible_combinations[extension] = {
-            'ids': extension[0],
-            'u_traveller_total': sum(shared_utilities),
-            'u_traveller_individual': list(shared_utilities.values()),
-            'veh_distance': calculate_distance(skim_matrix,
-                                               [requests.loc[t, 'origin'] for t in extension[0]] +
-                                               [requests.loc[t, 'destination'] for t in extension[1]]
-                                               ),
-            'kind': int(str(current_degree) + str(extension[1].index(extension[0][0]))),
-            'delays': delays,
-            'origin_order': extension[0],
-            'destination_order': extension[1]
-        }
-        feasible_combinations[extension]['t_travel'] = \
-            feasible_combinations[extension]['veh_distance'] * params['speed']
-
-        out = pd.DataFrame(feasible_combinations).transpose()
-
-        return out[ride_output_columns()]
+
+def sub_ride_positions(
+        signatures: np.ndarray,
+        origins: np.ndarray,
+        destinations: np.ndarray
+) -> np.ndarray:
+    """
+    Positions in signatures of sub-rides of rides of degree k+1 without
+    the member in the corresponding column of origins (-1 if absent)
+    :param signatures: sorted signatures, see ride_signatures
+    :param origins: origin orders of rides of degree k+1
+    :param destinations: destination orders of rides of degree k+1
+    :return: array of positions (n x k+1)
+    """
+    degree = origins.shape[1] - 1
+    positions = np.empty(origins.shape, dtype=np.int64)
+    for column in range(degree + 1):
+        traveller = origins[:, column]
+        positions[:, column] = _positions(signatures, np.hstack([
+            np.delete(origins, column, axis=1),
+            destinations[destinations != traveller[:, None]].reshape(-1, degree)
+        ]))
+    return positions
+
+
+def _row_keys(
+        rows: np.ndarray
+) -> np.ndarray:
+    """ Rows of an integer matrix as scalars (bytes), comparable for equality """
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    return rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1]))).ravel()
+
+
+def _positions(
+        sorted_keys: np.ndarray,
+        rows: np.ndarray
+) -> np.ndarray:
+    """ Positions of rows among the sorted keys (see _row_keys), -1 if absent """
+    if not len(sorted_keys):
+        return np.full(len(rows), -1)
+    keys = _row_keys(rows)
+    found = np.searchsorted(sorted_keys, keys).clip(max=len(sorted_keys) - 1)
+    return np.where(sorted_keys[found] == keys, found, -1)
+
+
+def _without(
+        order: tuple,
+        traveller: int
+) -> tuple:
+    return tuple(t for t in order if t != traveller)
+
+
+def _merge(
+        common: tuple,
+        first: int,
+        first_position: int,
+        second: int,
+        second_position: int
+) -> list:
+    """
+    All orders of common + {first, second} which restricted
+    to common + {first} and common + {second} give the sub-orders
+    """
+    if first_position < second_position:
+        return [common[:first_position] + (first,) + common[first_position:second_position]
+                + (second,) + common[second_position:]]
+    if first_position > second_position:
+        return [common[:second_position] + (second,) + common[second_position:first_position]
+                + (first,) + common[first_position:]]
+    return [common[:first_position] + (first, second) + common[first_position:],
+            common[:first_position] + (second, first) + common[first_position:]]
+
+
+def ride_kind(
+        origin_order: np.ndarray,
+        destination_order: np.ndarray
+) -> np.ndarray:
+    """ FIFO, LIFO or MIXED type of the rides """
+    degree = origin_order.shape[1]
+    if degree > 5:
+        return np.full(len(origin_order), PoolType.PLUS5)
+    fifo = (origin_order == destination_order).all(axis=1)
+    lifo = (origin_order == destination_order[:, ::-1]).all(axis=1)
+    return np.select([fifo, lifo],
+                     [getattr(PoolType, f'FIFO{degree}'), getattr(PoolType, f'LIFO{degree}')],
+                     getattr(PoolType, f'MIXED{degree}'))
+
+
+def traveller_bounds(
+        requests: RequestTable,
+        params: dict
+) -> dict:
+    """
+    Bounds for each traveller implied by a feasible and attractive shared ride:
+    the latest pick-up (request time plus the acceptable delay) and the maximal
+    in-vehicle time, at which the utility without delay equals that
+    of the private ride (given VoT, WtS and the share discount)
+    :param requests: table of requests
+    :param params: parameters of the simulation
+    :return: name -> array of the bound (in order of requests)
+    """
+    return {
+        'latest_pickup': requests.t_req_int + requests.max_delay / params['delay_value'],
+        'max_in_vehicle': (params['price'] * params['share_discount'] * requests.distance / 1000
+                           + requests.VoT * requests.t_ns - requests.ASC_pool)
+        / (requests.VoT * requests.WtS)
+    }
+
+
+def within_bounds(
+        origin_order: np.ndarray,
+        destination_order: np.ndarray,
+        requests: RequestTable,
+        params: dict,
+        embedding: np.ndarray,
+        nodes: np.ndarray,
+        tolerance: float = 1e-6
+) -> np.ndarray:
+    """
+    Necessary conditions for a candidate ride to be feasible and attractive,
+    verified on traveller_bounds with lower bounds of legs of the route
+    from the landmark embedding (no skim lookups). The minimal in-vehicle
+    time of each traveller must not exceed the maximal one, what is left
+    of it limits the delay further (through WtS). Pick-ups in the origin
+    order cannot happen earlier than the earliest pick-up of any previous
+    traveller plus the minimal time to get there, nor after the latest pick-up.
+    :param origin_order: order of pick-ups (n x k)
+    :param destination_order: order of drop-offs (n x k)
+    :param requests: table of requests
+    :param params: parameters of the simulation
+    :param embedding: landmark embedding of the nodes (see landmark_embedding)
+    :param nodes: sorted node ids of rows of the embedding
+    :param tolerance: slack in seconds for rounding errors
+    :return: boolean mask of candidates which may be attractive
+    """
+    degree = origin_order.shape[1]
+    bounds = traveller_bounds(requests, params)
+    pos_origin = requests.positions(origin_order)
+    pos_destination = requests.positions(destination_order)
+
+    # Lower bounds of times at consecutive stops of the route
+    route = np.hstack([pos_origin, pos_destination + len(requests)])
+    stops = embedding[np.searchsorted(nodes, np.concatenate([requests.origin, requests.destination]))]
+    legs = route_bounds(stops, route)
+    cumulative = np.hstack([np.zeros((len(route), 1)), np.cumsum(legs, axis=1)]) / params['speed']
+
+    in_vehicle = select_kernels(params.get('kernel_backend', 'auto')).traveller_distances(
+        cumulative, origin_order, destination_order)
+    max_in_vehicle = bounds['max_in_vehicle'][pos_origin]
+    possible = (in_vehicle <= max_in_vehicle + tolerance).all(axis=1)
+
+    # Delays which are acceptable and leave the ride attractive given the minimal in-vehicle time
+    request_time = requests.t_req_int[pos_origin]
+    window = np.minimum(bounds['latest_pickup'][pos_origin] - request_time,
+                        requests.WtS[pos_origin] * (max_in_vehicle - in_vehicle) / params['delay_value'])
+    pick_up = cumulative[:, :degree]
+    earliest = pick_up + np.maximum.accumulate(request_time - window - pick_up, axis=1)
+    return possible & (earliest <= request_time + window + tolerance).all(axis=1)
+
+
+def evaluate_rides(
+        origin_order: np.ndarray,
+        destination_order: np.ndarray,
+        requests: pd.DataFrame | RequestTable,
+        params: dict,
+        skim_matrix: Skim,
+        metrics: Metrics | None = None
+) -> RideTable:
+    """
+    Compute routes, delays and utilities of candidate rides
+    (all origins in origin_order, then all destinations in destination_order)
+    and keep the attractive ones
+    :param origin_order: order of pick-ups (n x k)
+    :param destination_order: order of drop-offs (n x k)
+    :param requests: original requests
+    :param params: parameters of the simulation
+    :param skim_matrix: distances within the city
+    :param metrics: collects numbers of candidates after each filter
+    :return: attractive rides
+    """
+    metrics = Metrics() if metrics is None else metrics
+    requests = RequestTable.from_requests(requests)
+    degree = origin_order.shape[1]
+    stage = f'degree_{degree}'
+    metrics.count(stage, 'candidates', len(origin_order))
+
+    # Cheap rejection with bounds of travellers and landmark bounds of legs,
+    # before routes are assembled from the skim
+    if params.get('spatial_landmarks', 8) and len(origin_order):
+        nodes = np.unique(np.concatenate([requests.origin, requests.destination]))
+        possible = within_bounds(origin_order, destination_order, requests, params,
+                                 landmark_embedding(skim_matrix, nodes, params.get('spatial_landmarks', 8)),
+                                 nodes)
+        origin_order, destination_order = origin_order[possible], destination_order[possible]
+        metrics.count(stage, 'bounds', len(origin_order))
+
+    return select_attractive(
+        origin_order=origin_order,
+        destination_order=destination_order,
+        geometry=ride_geometry(origin_order, destination_order, requests, skim_matrix,
+                               backend=params.get('kernel_backend', 'auto')),
+        requests=requests,
+        params=params,
+        metrics=metrics
+    )
+
+
+def ride_geometry(
+        origin_order: np.ndarray,
+        destination_order: np.ndarray,
+        requests: RequestTable,
+        skim_matrix: Skim,
+        backend: str = 'auto'
+) -> dict:
+    """
+    Distances along routes of candidate rides (all pick-ups, then all drop-offs)
+    :param origin_order: order of pick-ups (n x k)
+    :param destination_order: order of drop-offs (n x k)
+    :param requests: table of requests
+    :param skim_matrix: distances within the city
+    :param backend: kernel backend, see select_kernels
+    :return: 'cumulative' distance at consecutive stops (n x 2k) and
+    'distance' travelled by each traveller, in order of origins (n x k)
+    """
+    pos_origin = requests.positions(origin_order)
+    pos_destination = requests.positions(destination_order)
+
+    # Route: all pick-ups followed by all drop-offs
+    route = np.hstack([requests.origin[pos_origin], requests.destination[pos_destination]])
+    legs = skim_matrix[route[:, :-1], route[:, 1:]]
+    cumulative = np.hstack([np.zeros((len(route), 1)), np.cumsum(legs, axis=1)])
+
+    # Distance travelled by each traveller (in order of origins)
+    distance = select_kernels(backend).traveller_distances(cumulative, origin_order, destination_order)
+
+    return {'cumulative': cumulative, 'distance': distance}
+
+
+def select_attractive(
+        origin_order: np.ndarray,
+        destination_order: np.ndarray,
+        geometry: dict,
+        requests: RequestTable,
+        params: dict,
+        metrics: Metrics | None = None
+) -> RideTable:
+    """
+    Delays and utilities of candidate rides given their ride_geometry,
+    keep rides with acceptable delays which are attractive for all travellers
+    :return: attractive rides
+    """
+    metrics = Metrics() if metrics is None else metrics
+    degree = origin_order.shape[1]
+    stage = f'degree_{degree}'
+    pos_origin = requests.positions(origin_order)
+    cumulative, distance = geometry['cumulative'], geometry['distance']
+
+    # Delays - departure chosen so that deviations from requested times sum to zero
+    pick_up_time = cumulative[:, :degree] / params['speed']
+    request_time = requests.t_req_int[pos_origin]
+    start_time = np.mean(request_time - pick_up_time, axis=1, keepdims=True)
+    delays = start_time + pick_up_time - request_time
+
+    feasible_delay = (np.abs(delays) <= requests.max_delay[pos_origin] / params['delay_value']).all(axis=1)
+
+    utilities = shared_utilities(
+        travellers=pos_origin,
+        travel_time=distance / params['speed'],
+        delay=delays,
+        requests=requests,
+        params=params
+    )
+    attractive = feasible_delay & (utilities >= requests.u_ns[pos_origin]).all(axis=1)
+    metrics.count(stage, 'delay', feasible_delay.sum())
+    metrics.count(stage, 'attractive', attractive.sum())
+
+    return RideTable(
+        ids=origin_order[attractive],
+        origin_order=origin_order[attractive],
+        destination_order=destination_order[attractive],
+        delays=delays[attractive],
+        u_traveller_individual=utilities[attractive],
+        kind=ride_kind(origin_order[attractive], destination_order[attractive]),
+        veh_distance=cumulative[attractive, -1],
+        t_travel=cumulative[attractive, -1] / params['speed']
+    )
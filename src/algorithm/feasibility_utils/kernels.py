@@ -0,0 +1,154 @@
+""" Kernels of branchy per-ride computations with interchangeable backends (NumPy or Numba) """
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # optional, kernels fall back to NumPy
+    numba = None
+
+# 'python' runs the loops of the Numba kernels uncompiled (slow, for checks without Numba)
+KERNEL_BACKENDS = ['auto', 'numpy', 'numba', 'python']
+
+
+@dataclass(frozen=True)
+class Kernels:
+    """
+    Implementations of the kernels, all backends return identical results:
+    pair_travel_times(t_oo, t_ij, t_dd, t_dd_lifo, t_ns_j) -> in-vehicle times of
+    i and j in FIFO and LIFO pairs (n x 4: i_fifo, i_lifo, j_fifo, j_lifo),
+    t_dd (d_i -> d_j) ends FIFO rides and t_dd_lifo (d_j -> d_i) LIFO rides,
+    split_delay(delay, max_delay_i, max_delay_j) -> delay of i (see split_delay),
+    traveller_distances(cumulative, origin_order, destination_order) ->
+    distance travelled by each traveller in order of origins (n x k),
+    given the cumulative distance at consecutive stops (n x 2k)
+    """
+    name: str
+    pair_travel_times: Callable
+    split_delay: Callable
+    traveller_distances: Callable
+
+
+def pair_travel_times(
+        t_oo: np.ndarray,
+        t_ij: np.ndarray,
+        t_dd: np.ndarray,
+        t_dd_lifo: np.ndarray,
+        t_ns_j: np.ndarray
+) -> np.ndarray:
+    """ Travel times in pairs (see Kernels), i is picked up first """
+    return np.column_stack([
+        t_oo + t_ij,
+        t_oo + t_ns_j + t_dd_lifo,
+        t_ij + t_dd,
+        t_ns_j
+    ])
+
+
+def split_delay(
+        delay: np.ndarray,
+        max_delay_i: np.ndarray,
+        max_delay_j: np.ndarray
+) -> np.ndarray:
+    """ Split the delay between the travellers, return delay of the first one """
+    return np.minimum(np.minimum(np.abs(delay / 2), max_delay_i), max_delay_j) * \
+        np.where(delay < 0, 1, -1)
+
+
+def traveller_distances(
+        cumulative: np.ndarray,
+        origin_order: np.ndarray,
+        destination_order: np.ndarray
+) -> np.ndarray:
+    """ Distances of travellers along routes (see Kernels) """
+    degree = origin_order.shape[1]
+    drop_off = degree + np.argmax(destination_order[:, None, :] == origin_order[:, :, None], axis=2)
+    pick_up = np.broadcast_to(np.arange(degree), origin_order.shape)
+    rows = np.arange(len(cumulative))[:, None]
+    return cumulative[rows, drop_off] - cumulative[rows, pick_up]
+
+
+def _pair_travel_times_loop(t_oo, t_ij, t_dd, t_dd_lifo, t_ns_j):
+    out = np.empty((len(t_oo), 4), dtype=np.int64)
+    for row in range(len(t_oo)):
+        out[row, 0] = t_oo[row] + t_ij[row]
+        out[row, 1] = t_oo[row] + t_ns_j[row] + t_dd_lifo[row]
+        out[row, 2] = t_ij[row] + t_dd[row]
+        out[row, 3] = t_ns_j[row]
+    return out
+
+
+def _split_delay_loop(delay, max_delay_i, max_delay_j):
+    out = np.empty(len(delay))
+    for row in range(len(delay)):
+        value = min(min(abs(delay[row] / 2), max_delay_i[row]), max_delay_j[row])
+        out[row] = value if delay[row] < 0 else -value
+    return out
+
+
+def _traveller_distances_loop(cumulative, origin_order, destination_order):
+    rows, degree = origin_order.shape
+    out = np.empty((rows, degree))
+    for row in range(rows):
+        for pick_up in range(degree):
+            drop_off = 0
+            while destination_order[row, drop_off] != origin_order[row, pick_up]:
+                drop_off += 1
+            out[row, pick_up] = cumulative[row, degree + drop_off] - cumulative[row, pick_up]
+    return out
+
+
+def _typed(
+        loop: Callable,
+        *dtypes
+) -> Callable:
+    """ Loop kernels take contiguous arrays of fixed types (one compiled signature) """
+    def kernel(*arrays):
+        return loop(*(np.ascontiguousarray(values, dtype=dtype) for values, dtype in zip(arrays, dtypes)))
+    return kernel
+
+
+NUMPY_KERNELS = Kernels(
+    name='numpy',
+    pair_travel_times=pair_travel_times,
+    split_delay=split_delay,
+    traveller_distances=traveller_distances
+)
+
+
+@lru_cache(maxsize=None)
+def loop_kernels(
+        jit: bool = True
+) -> Kernels:
+    """
+    Kernels as explicit loops, compiled with Numba (once per process)
+    :param jit: compile the loops, otherwise they run as plain Python
+    """
+    compile_loop = numba.njit(cache=True) if jit else (lambda loop: loop)
+    return Kernels(
+        name='numba' if jit else 'python',
+        pair_travel_times=_typed(compile_loop(_pair_travel_times_loop), *[np.int64] * 5),
+        split_delay=_typed(compile_loop(_split_delay_loop), *[np.float64] * 3),
+        traveller_distances=_typed(compile_loop(_traveller_distances_loop),
+                                   np.float64, np.int64, np.int64)
+    )
+
+
+def select_kernels(
+        backend: str = 'auto'
+) -> Kernels:
+    """
+    Kernels of the backend: 'numpy', 'numba', 'python' or 'auto' (Numba if installed)
+    :param backend: one of KERNEL_BACKENDS
+    :return: kernels
+    """
+    assert backend in KERNEL_BACKENDS, f"Kernel backend must be one of {KERNEL_BACKENDS}"
+    if backend == 'python':
+        return loop_kernels(jit=False)
+    if backend == 'numba' or (backend == 'auto' and numba is not None):
+        assert numba is not None, "Numba is not installed, use the 'numpy' kernel backend"
+        return loop_kernels(jit=True)
+    return NUMPY_KERNELS
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 
@@ -6,10 +7,10 @@ def maximum_delay(
         parameters: dict
 ):
     """ Calculate maximum delay acceptable for the traveller """
-    return list(map(lambda x: x if x >= 0 else 0,
-                    (1 / requests['WtS'] - 1) * requests['t_ns'] +
-                    (parameters['price'] * parameters['share_discount'] *
-                     requests['distance'] / 1000) / (requests['VoT'] * requests['WtS'])))
+    delay = ((1 / requests['WtS'] - 1) * requests['t_ns'] +
+             (parameters['price'] * parameters['share_discount'] *
+              requests['distance'] / 1000) / (requests['VoT'] * requests['WtS'])).to_numpy()
+    return np.where(delay >= 0, delay, 0)
 
 
 def ride_output_columns():
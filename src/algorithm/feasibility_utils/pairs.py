@@ -1,197 +1,482 @@
 """ Part of algorithm, where one calculates feasible pairs """
 from logging import Logger
-import math
 from itertools import product
 
+import numpy as np
 import pandas as pd
 
 from algorithm.feasibility_utils.utility_functions import utility_pairs
 from utilities.general_utils import optional_log
-from algorithm.feasibility_utils.miscellaneous import pairs_calculation_ride, ride_output_columns
+from utilities.metrics import Metrics
+from utilities.skim import Skim, widen_distances
+from algorithm.feasibility_utils.kernels import select_kernels
+from algorithm.feasibility_utils.miscellaneous import pairs_calculation_ride
 from algorithm.feasibility_utils.pooltype import PoolType
+from algorithm.feasibility_utils.request_table import RequestTable
+from algorithm.feasibility_utils.ride_table import RideTable
+from algorithm.feasibility_utils.spatial import landmark_embedding, spatially_compatible
 
 
 def pair_pool(
-        requests: pd.DataFrame,
+        requests: pd.DataFrame | RequestTable,
         params: dict,
-        skim_matrix: pd.DataFrame,
-        logger: Logger | None
-):
-    """ Calculate pooling combinations of degree two """
-    sizes = {'initial': 4 * math.pow(len(requests), 2)}
-    sizes['current'] = sizes['initial']
-    sizes['prev_step'] = sizes['initial']
-
-    optional_log(20, "Calculating values for pairs ...", logger)
-
-    cols = pairs_calculation_ride()
-    pairs = pd.DataFrame(
-        index=pd.MultiIndex.from_product([requests['traveller_id']] * 2)
-    )
+        skim_matrix: Skim,
+        logger: Logger | None,
+        metrics: Metrics | None = None,
+        among: np.ndarray | None = None
+) -> RideTable:
+    """
+    Calculate pooling combinations of degree two, with among
+    (positions of requests) only pairs including one of them
+    """
+    metrics = Metrics() if metrics is None else metrics
+    requests = RequestTable.from_requests(requests)
+    with metrics.stage('pair_filters'):
+        pairs = feasible_pairs(
+            requests=requests,
+            params=params,
+            skim_matrix=skim_matrix,
+            logger=logger,
+            metrics=metrics,
+            among=among
+        )
+    with metrics.stage('pair_utilities'):
+        return attractive_pairs(
+            pairs=pairs,
+            requests=requests,
+            params=params,
+            logger=logger,
+            metrics=metrics
+        )
 
-    pairs[[col + "_i" for col in cols]] = requests.loc[pairs.index.get_level_values(0)][cols].set_index(pairs.index)  # assign columns
-    pairs[[col + "_j" for col in cols]] = requests.loc[pairs.index.get_level_values(1)][cols].set_index(pairs.index)
 
-    pairs['i'] = pairs.index.get_level_values(0)
-    pairs['j'] = pairs.index.get_level_values(1)
+def feasible_pairs(
+        requests: pd.DataFrame | RequestTable,
+        params: dict,
+        skim_matrix: Skim,
+        logger: Logger | None,
+        metrics: Metrics | None = None,
+        among: np.ndarray | None = None
+) -> pd.DataFrame:
+    """
+    Pairs of travellers compatible in time and space
+    with their FIFO and LIFO travel times. Numbers of (ordered)
+    pairs left after consecutive filters are recorded in metrics.
+    """
+    metrics = Metrics() if metrics is None else metrics
+    pairs = pair_geometry(
+        requests=requests,
+        params=params,
+        skim_matrix=skim_matrix,
+        logger=logger,
+        metrics=metrics,
+        among=among
+    )
+    return delay_feasible(
+        pairs=pairs,
+        params=params,
+        logger=logger,
+        metrics=metrics
+    )
 
-    pairs = pairs.loc[pairs['i'] != pairs['j']]
 
-    # Reduce size of the skim (distances) matrix
-    skim_indexes = list(set(list(requests['origin']) + list(requests['destination'])))
-    skim = skim_matrix.loc[skim_indexes, skim_indexes].copy()
+def pair_geometry(
+        requests: pd.DataFrame | RequestTable,
+        params: dict,
+        skim_matrix: Skim,
+        logger: Logger | None,
+        metrics: Metrics | None = None,
+        among: np.ndarray | None = None
+) -> pd.DataFrame:
+    """
+    Pairs of travellers compatible in time (given their max_delay)
+    with travel times of legs of FIFO and LIFO rides. Apart from max_delay,
+    only the horizon and speed are used (no behavioural parameters).
+    With among (positions of requests), only pairs including one of them.
+    """
+    metrics = Metrics() if metrics is None else metrics
+    requests = RequestTable.from_requests(requests)
+    optional_log(10 if among is not None else 20, "Calculating values for pairs ...", logger)
+
+    # Ordered pairs of travellers which may pass the time filters
+    pos_i, pos_j = candidate_pairs(
+        requests=requests,
+        horizon=params.get('horizon', 0),
+        among=among
+    )
+    if among is None:
+        metrics.count('pairs', 'all', len(requests) * (len(requests) - 1))
+    else:
+        metrics.count('pairs', 'all', len(among) * (2 * len(requests) - len(among) - 1))
+    metrics.count('pairs', 'time_sweep', len(pos_i), logger)
 
-    # Convert distances to travel time
-    skim = skim.div(params["speed"]).astype(int)
+    # Filters before any skim lookup use only a few columns of the pairs
+    times = _pair_columns(requests, pos_i, pos_j, ['t_req_int', 't_ns', 'max_delay'])
+    compatible = np.ones(len(pos_i), dtype=bool)
 
     # If user provides a planning horizon, conduct corresponding filtering
     if params.get('horizon', 0) > 0:
-        pairs = pairs[abs(pairs['t_req_int_i'] - pairs['t_req_int_j']) < params['horizon']]
-        sizes['current'] = 2 * len(pairs)
-        optional_log(0, f"Horizon criterion removed "
-                        f"{sizes['current'] - sizes['prev_step']}",
-                     logger)
-        sizes['prev_step'] = 2 * len(pairs)
+        compatible &= abs(times['t_req_int_i'] - times['t_req_int_j']) < params['horizon']
+        metrics.count('pairs', 'horizon', compatible.sum(), logger)
 
     # Query based on travellers' acceptable time windows (departure compatibility)
-    pairs = pairs.loc[(pairs['t_req_int_j'] + pairs['max_delay_j'] >=
-                       pairs['t_req_int_i'] - pairs['max_delay_i']) &
-                      (pairs['t_req_int_j'] - pairs['max_delay_j'] <=
-                       pairs['t_req_int_i'] + pairs['t_ns_i'] + pairs['max_delay_i'])]
+    compatible &= time_compatible(times)
+    metrics.count('pairs', 'time_window', compatible.sum(), logger)
+
+    # Discard pairs too far apart judging by lower bounds of distances (no skim lookups)
+    if params.get('spatial_landmarks', 8):
+        compatible[compatible] = _spatial_prefilter(
+            pos_i=pos_i[compatible],
+            pos_j=pos_j[compatible],
+            requests=requests,
+            params=params,
+            skim_matrix=skim_matrix
+        )
+        metrics.count('pairs', 'spatial', compatible.sum(), logger)
+    pairs = _pairs_table(requests, pos_i[compatible], pos_j[compatible])
+
+    # Reduce size of the skim (distances) matrix to travellers of candidate pairs
+    travellers = _travellers(requests, pairs['pos_i'].to_numpy(), pairs['pos_j'].to_numpy())
+    skim_indexes = np.concatenate([requests.origin[travellers], requests.destination[travellers]])
+    skim = skim_matrix.subset(skim_indexes)
+
+    # Rows of origins and destinations (by request position) in the reduced skim
+    skim_rows = {}
+    for end in ['origin', 'destination']:
+        skim_rows[end] = np.zeros(len(requests), dtype=np.int64)
+        skim_rows[end][travellers] = skim.positions(getattr(requests, end)[travellers])
+
+    def _distance(_pairs: pd.DataFrame, _from: str, _to: str) -> np.ndarray:
+        (from_end, from_ij), (to_end, to_ij) = _from.split('_'), _to.split('_')
+        return widen_distances(np.asarray(skim.matrix)[skim_rows[from_end][_pairs['pos_' + from_ij].to_numpy()],
+                                                       skim_rows[to_end][_pairs['pos_' + to_ij].to_numpy()]])
+
+    def _travel_time(distance: np.ndarray) -> np.ndarray:
+        # Unreachable legs (inf) cannot be cast, rides using them are excluded below
+        return (np.where(np.isfinite(distance), distance, 0) / params['speed']).astype(int)
 
     # Calculate and filter for origin compatibility
-    pairs['t_oo'] = pairs.apply(
-        lambda x: int(skim.loc[x['origin_i'], x['origin_j']] / params['speed']),
-        axis=1
+    origin_distance = _distance(pairs, 'origin_i', 'origin_j')
+    pairs = pairs.assign(t_oo=_travel_time(origin_distance))
+    compatible = origin_compatible(pairs) & np.isfinite(origin_distance)
+    if params.get('dist_threshold'):
+        compatible &= origin_distance <= params['dist_threshold']
+    pairs = pairs.loc[compatible]
+    metrics.count('pairs', 'origin_compatibility', len(pairs), logger)
+
+    # Compute trip characteristics, the last leg is d_i -> d_j in FIFO
+    # and d_j -> d_i in LIFO rides (they differ in asymmetric skims),
+    # rides with an unreachable leg are not reachable
+    destination_distance = _distance(pairs, 'destination_i', 'destination_j')
+    ij_distance = _distance(pairs, 'origin_j', 'destination_i')
+    lifo_distance = _distance(pairs, 'destination_j', 'destination_i')
+    pairs = pairs.assign(
+        t_ij=_travel_time(ij_distance),
+        t_ji=_travel_time(_distance(pairs, 'origin_i', 'destination_j')),
+        t_dd=_travel_time(destination_distance),
+        t_dd_lifo=_travel_time(lifo_distance),
+        fifo_reachable=np.isfinite(ij_distance) & np.isfinite(destination_distance),
+        lifo_reachable=np.isfinite(lifo_distance)
+    )
+    if params.get('dist_threshold'):
+        pairs = pairs.loc[destination_distance <= params['dist_threshold']]
+        metrics.count('pairs', 'destination_distance', len(pairs), logger)
+    pairs = pairs.loc[pairs['fifo_reachable'] | pairs['lifo_reachable']]
+
+    travel_times = select_kernels(params.get('kernel_backend', 'auto')).pair_travel_times(
+        pairs['t_oo'].to_numpy(), pairs['t_ij'].to_numpy(), pairs['t_dd'].to_numpy(),
+        pairs['t_dd_lifo'].to_numpy(), pairs['t_ns_j'].to_numpy()
+    )
+    for num, (ij, fl) in enumerate(product(['i', 'j'], ['fifo', 'lifo'])):
+        pairs['t_s_' + ij + '_' + fl] = travel_times[:, num]
+
+    optional_log(10, 'Travel times calculated', logger)
+
+    return pairs
+
+
+def _spatial_prefilter(
+        pos_i: np.ndarray,
+        pos_j: np.ndarray,
+        requests: RequestTable,
+        params: dict,
+        skim_matrix: Skim
+) -> np.ndarray:
+    """ Landmark embedding of nodes of the pairs and spatially_compatible mask """
+    travellers = _travellers(requests, pos_i, pos_j)
+    nodes = np.unique(np.concatenate([requests.origin[travellers], requests.destination[travellers]]))
+    return spatially_compatible(
+        pos_i=pos_i,
+        pos_j=pos_j,
+        requests=requests,
+        embedding=landmark_embedding(skim_matrix, nodes, params.get('spatial_landmarks', 8)),
+        nodes=nodes,
+        params=params
     )
 
-    pairs = pairs.loc[(pairs['t_req_int_i'] + pairs['t_oo'] + pairs['max_delay_i'] >=
-                       pairs['t_req_int_j'] - pairs['max_delay_j']) &
-                      (pairs['t_req_int_i'] + pairs['t_oo'] - pairs['max_delay_i'] <=
-                       pairs['t_req_int_j'] + pairs['max_delay_j'])]
 
-    sizes['current'] = 2 * len(pairs)
-    optional_log(0,
-                 f"Initial filtering reduced size from "
-                 f"{sizes['prev_step']} to {sizes['current']}",
-                 logger)
-    sizes['prev_step'] = sizes['current']
+def _travellers(
+        requests: RequestTable,
+        pos_i: np.ndarray,
+        pos_j: np.ndarray
+) -> np.ndarray:
+    """ Sorted positions of travellers of the pairs """
+    return np.flatnonzero(np.bincount(pos_i, minlength=len(requests)) +
+                          np.bincount(pos_j, minlength=len(requests)))
+
+
+def time_compatible(
+        pairs: pd.DataFrame | dict
+) -> pd.Series | np.ndarray:
+    """ Time windows of travellers allow for the 2nd pick-up during the 1st trip """
+    return (pairs['t_req_int_j'] + pairs['max_delay_j'] >=
+            pairs['t_req_int_i'] - pairs['max_delay_i']) & \
+        (pairs['t_req_int_j'] - pairs['max_delay_j'] <=
+         pairs['t_req_int_i'] + pairs['t_ns_i'] + pairs['max_delay_i'])
+
+
+def origin_compatible(
+        pairs: pd.DataFrame
+) -> pd.Series:
+    """ The 2nd origin can be reached within the time windows """
+    return (pairs['t_req_int_i'] + pairs['t_oo'] + pairs['max_delay_i'] >=
+            pairs['t_req_int_j'] - pairs['max_delay_j']) & \
+        (pairs['t_req_int_i'] + pairs['t_oo'] - pairs['max_delay_i'] <=
+         pairs['t_req_int_j'] + pairs['max_delay_j'])
+
+
+def delay_feasible(
+        pairs: pd.DataFrame,
+        params: dict,
+        logger: Logger | None,
+        metrics: Metrics | None = None
+) -> pd.DataFrame:
+    """ Split the delay at the 2nd origin and keep pairs with acceptable delays """
+    metrics = Metrics() if metrics is None else metrics
 
     # Determine whether 2nd origin is reachable within accepted time
-    pairs['delay'] = pairs['t_req_int_i'] + pairs['t_oo'] + pairs['t_req_int_j']
-    pairs['delay_i'] = pairs.apply(
-        lambda x: min(abs(x['delay'] / 2), x['max_delay_i'], x['max_delay_i']) *
-                  (1 if x['delay'] < 0 else -1),
-        axis=1
+    pairs = pairs.assign(delay=pairs['t_req_int_i'] + pairs['t_oo'] - pairs['t_req_int_j'])
+    pairs['delay_i'] = select_kernels(params.get('kernel_backend', 'auto')).split_delay(
+        pairs['delay'].to_numpy(),
+        pairs['max_delay_i'].to_numpy(),
+        pairs['max_delay_j'].to_numpy()
     )
-    pairs['delay_j'] = pairs.delay + pairs.delay_i
+    pairs['delay_j'] = pairs['delay'] + pairs['delay_i']
 
     for ij in ['i', 'j']:
         pairs = pairs[abs(pairs['delay_' + ij]) <= pairs['max_delay_' + ij] / params['delay_value']]
+    metrics.count('pairs', 'delay', len(pairs), logger)
 
-    sizes['current'] = 2 * len(pairs)
-    optional_log(0, f"Origin compatibility filtered from {sizes['prev_step']}"
-                    f"to {sizes['current']}.", logger)
-    sizes['prev_step'] = sizes['current']
+    return pairs
 
-    # Compute trip characteristics
-    pairs['t_ij'] = pairs.apply(
-        lambda x: int(skim.loc[x['origin_j'], x['destination_i']] / params['speed']),
-        axis=1
-    )
-    pairs['t_ji'] = pairs.apply(
-        lambda x: int(skim.loc[x['origin_i'], x['destination_j']] / params['speed']),
-        axis=1
-    )
-    pairs['t_dd'] = pairs.apply(
-        lambda x: int(skim.loc[x['destination_i'], x['destination_j']] / params['speed']),
-        axis=1
+
+def scenario_pairs(
+        geometry: pd.DataFrame,
+        requests: RequestTable,
+        params: dict,
+        logger: Logger | None,
+        metrics: Metrics | None = None
+) -> pd.DataFrame:
+    """
+    Feasible pairs of a behavioural scenario from pair_geometry computed
+    with max_delay at least as large for every traveller (time filters
+    are monotone in max_delay, hence the scenario pairs are a subset)
+    :param geometry: output of pair_geometry
+    :param requests: requests of the scenario, in the order used for the geometry
+    :param params: parameters of the scenario
+    :param logger: for logging purposes
+    :param metrics: collects numbers of candidates after each filter
+    :return: as feasible_pairs
+    """
+    metrics = Metrics() if metrics is None else metrics
+    pairs = geometry.copy()
+    for col in pairs_calculation_ride():
+        values = getattr(requests, col)
+        pairs[col + '_i'] = values[pairs['pos_i'].to_numpy()]
+        pairs[col + '_j'] = values[pairs['pos_j'].to_numpy()]
+
+    pairs = pairs.loc[time_compatible(pairs) & origin_compatible(pairs)]
+    metrics.count('pairs', 'origin_compatibility', len(pairs), logger)
+    return delay_feasible(
+        pairs=pairs,
+        params=params,
+        logger=logger,
+        metrics=metrics
     )
 
-    optional_log(10, 'Travel times calculated', logger)
 
-    # Now check for utilities with FIFO and LIFO
-    for ij, fl in product(['i', 'j'], ['fifo', 'lifo']):
-        # First, calculate time
-        pairs['t_s_' + ij + '_' + fl] = pairs.apply(
-            travel_times,
-            i_j=ij,
-            fifo_lifo=fl,
-            axis=1
-        )
-        # Now proceed to utility
-        pairs['u_s_' + ij + '_' + fl] = pairs.apply(
-            utility_pairs,
-            i_j=ij,
-            fifo_lifo=fl,
-            axis=1
-        )
+def attractive_pairs(
+        pairs: pd.DataFrame,
+        requests: pd.DataFrame | RequestTable,
+        params: dict,
+        logger: Logger | None,
+        metrics: Metrics | None = None
+) -> RideTable:
+    """ Utilities of feasible pairs, attractive FIFO and LIFO rides """
+    metrics = Metrics() if metrics is None else metrics
+    pairs = pairs.copy()
+
+    # Now check for utilities with FIFO and LIFO, all in one call
+    utilities = utility_pairs(
+        travellers=pairs[['pos_i', 'pos_j']].to_numpy(),
+        travel_times=np.stack([pairs[['t_s_i_' + fl, 't_s_j_' + fl]].to_numpy()
+                               for fl in ['fifo', 'lifo']], axis=1),
+        delays=pairs[['delay_i', 'delay_j']].to_numpy(),
+        requests=RequestTable.from_requests(requests),
+        params=params
+    )
+    for (num_fl, fl), (num_ij, ij) in product(enumerate(['fifo', 'lifo']), enumerate(['i', 'j'])):
+        pairs['u_s_' + ij + '_' + fl] = utilities[:, num_fl, num_ij]
 
     optional_log(10, 'Utilities for pairs calculated', logger)
 
     # Extract attractive FIFO and LIFO rides
     for fl in ['fifo', 'lifo']:
-        pairs[fl + '_attractive'] = pairs.apply(
-            check_attractiveness,
-            fifo_lifo=fl,
-            axis=1
-        )
-
-    return pd.concat([extract_attractive(pairs, t, params) for t in ['fifo', 'lifo']])
-
-
-def travel_times(
-        ride_row: pd.Series,
-        i_j: str,
-        fifo_lifo: str
-):
-    """ Calculate travel times """
-    if i_j == 'i':
-        time = ride_row['t_oo']
-        if fifo_lifo == 'fifo':
-            return time + ride_row['t_ji']
-        return time + ride_row['t_ns_j'] + ride_row['t_dd']
+        pairs[fl + '_attractive'] = check_attractiveness(
+            rides=pairs,
+            fifo_lifo=fl
+        ) & pairs[fl + '_reachable']
+        metrics.count('pairs', fl + '_attractive', pairs[fl + '_attractive'].sum(), logger)
+
+    return RideTable.concat([extract_attractive(pairs, t, params) for t in ['fifo', 'lifo']])
+
+
+def candidate_pairs(
+        requests: RequestTable,
+        horizon: float = 0,
+        among: np.ndarray | None = None
+) -> (np.ndarray, np.ndarray):
+    """
+    Generate candidate pairs with a sort-and-sweep over request times.
+    For each traveller i only travellers j whose request time lies
+    within [t_i - max_delay_i - max(max_delay), t_i + t_ns_i + max_delay_i
+    + max(max_delay)] (and within the horizon) are emitted, hence
+    the cost scales with the number of candidates rather than N^2.
+    The exact horizon and time-window filters are applied afterwards.
+    :param requests: requests with t_req_int, t_ns and max_delay
+    :param horizon: planning horizon, 0 for no horizon
+    :param among: if passed, only pairs with one of the travellers at
+    these positions are emitted (cost scales with their candidates)
+    :return: positions (in requests) of the first and second traveller
+    """
+    t_req = requests.t_req_int
+    t_ns = requests.t_ns
+    max_delay = requests.max_delay
+    if not len(t_req):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    order = np.argsort(t_req, kind='stable')
+    t_sorted = t_req[order]
+
+    widest_delay = max_delay.max()
+    low = t_req - max_delay - widest_delay
+    high = t_req + t_ns + max_delay + widest_delay
+    if horizon > 0:
+        low = np.maximum(low, t_req - horizon)
+        high = np.minimum(high, t_req + horizon)
+
+    if among is None:
+        pos_i, pos_j = _sweep(np.arange(len(t_req)), order, t_sorted, low, high)
     else:
-        if fifo_lifo == 'fifo':
-            return ride_row['t_ji'] + ride_row['t_dd']
-        return ride_row['t_ns_j']
+        among = np.asarray(among, dtype=np.int64)
+        # Second travellers among: first travellers whose window contains them,
+        # windows lie within [t - 2 widest_delay, t + t_ns + 2 widest_delay]
+        second, first = _sweep(among, order, t_sorted,
+                               t_req[among] - t_ns.max() - 2 * widest_delay,
+                               t_req[among] + 2 * widest_delay)
+        within = (low[first] <= t_req[second]) & (t_req[second] <= high[first])
+        pos_i, pos_j = _sweep(among, order, t_sorted, low[among], high[among])
+        # Pairs of two travellers among are emitted twice
+        pos_i, pos_j = np.unique(np.column_stack([np.concatenate([pos_i, first[within]]),
+                                                  np.concatenate([pos_j, second[within]])]), axis=0).T
+
+    different = pos_i != pos_j
+    return pos_i[different], pos_j[different]
+
+
+def _sweep(
+        positions: np.ndarray,
+        order: np.ndarray,
+        t_sorted: np.ndarray,
+        low: np.ndarray,
+        high: np.ndarray
+) -> (np.ndarray, np.ndarray):
+    """ Pairs of positions and travellers with request time within [low, high] """
+    first = np.searchsorted(t_sorted, low, side='left')
+    last = np.searchsorted(t_sorted, high, side='right')
+    counts = np.maximum(last - first, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(positions, counts), order[np.repeat(first, counts) + offsets]
+
+
+def _pairs_table(
+        requests: RequestTable,
+        pos_i: np.ndarray,
+        pos_j: np.ndarray
+) -> pd.DataFrame:
+    """ Columnar table of candidate pairs given positions of travellers """
+    columns = {
+        'i': requests.traveller_id[pos_i],
+        'j': requests.traveller_id[pos_j],
+        'pos_i': pos_i,
+        'pos_j': pos_j
+    }
+    columns.update(_pair_columns(requests, pos_i, pos_j, pairs_calculation_ride()))
+    return pd.DataFrame(columns)
+
+
+def _pair_columns(
+        requests: RequestTable,
+        pos_i: np.ndarray,
+        pos_j: np.ndarray,
+        names: list
+) -> dict:
+    """ Columns of both travellers of pairs (name_i, name_j) as arrays """
+    columns = {}
+    for col in names:
+        values = getattr(requests, col)
+        columns[col + '_i'] = values[pos_i]
+        columns[col + '_j'] = values[pos_j]
+    return columns
 
 
 def check_attractiveness(
-        ride_row: pd.Series,
+        rides: pd.DataFrame,
         fifo_lifo: str
-):
+) -> pd.Series:
     """ Check whether shared ride is more attractive in fifo/lifo """
-    return (ride_row['u_s_i_' + fifo_lifo] < ride_row['u_ns_i']) & \
-        (ride_row['u_s_j' + fifo_lifo] < ride_row['u_ns_j'])
+    return (rides['u_s_i_' + fifo_lifo] >= rides['u_ns_i']) & \
+        (rides['u_s_j_' + fifo_lifo] >= rides['u_ns_j'])
 
 
 def extract_attractive(
         rides: pd.DataFrame,
         fifo_lifo: str,
         parameters: dict
-):
+) -> RideTable:
     """ Extract to desired output """
     attractive = rides.loc[rides[fifo_lifo + '_attractive']]
-    out = pd.DataFrame(columns=ride_output_columns(), index=attractive.index)
-    out['ids'] = out.apply(lambda x: [x['i'], x['j']], axis=1)
-    out['u_traveller_individual'] = out.apply(
-        lambda x: [x['u_s_i_' + fifo_lifo], x['u_s_j_' + fifo_lifo]],
-        axis=1
-    )
-    out['u_traveller_total'] = out['u_traveller_individual'].apply(lambda x: sum(x))
-    out['veh_distance'] = out['t_travel'] * parameters['speed']
-    out['origin_order'] = out.apply(lambda x: [x['i'], x['j']], axis=1)
-    out['delays'] = out.apply(lambda x: [x['delay_i'], x['delay_j']], axis=1)
+    i = attractive['i'].to_numpy()
+    j = attractive['j'].to_numpy()
+
     if fifo_lifo == 'fifo':
-        out['t_travel'] = out['t_oo'] + out['t_ij'] + out['t_dd']
-        out['destination_order'] = out.apply(lambda x: [x['i'], x['j']], axis=1)
-        out['kind'] = PoolType.FIFO2
+        t_travel = (attractive['t_oo'] + attractive['t_ij'] + attractive['t_dd']).to_numpy()
+        destination_order = np.column_stack([i, j])
+        kind = PoolType.FIFO2
     else:
-        out['t_travel'] = out['t_oo'] + out['t_ns_j'] + out['t_dd']
-        out['destination_order'] = out.apply(lambda x: [x['j'], x['i']], axis=1)
-        out['kind'] = PoolType.LIFO2
-
-    return out
-
-
+        t_travel = (attractive['t_oo'] + attractive['t_ns_j'] + attractive['t_dd_lifo']).to_numpy()
+        destination_order = np.column_stack([j, i])
+        kind = PoolType.LIFO2
+
+    return RideTable(
+        ids=np.column_stack([i, j]),
+        origin_order=np.column_stack([i, j]),
+        destination_order=destination_order,
+        delays=np.column_stack([attractive['delay_i'].to_numpy(),
+                                attractive['delay_j'].to_numpy()]),
+        u_traveller_individual=np.column_stack([attractive['u_s_i_' + fifo_lifo].to_numpy(),
+                                                attractive['u_s_j_' + fifo_lifo].to_numpy()]),
+        kind=kind,
+        veh_distance=t_travel * parameters['speed'],
+        t_travel=t_travel
+    )
@@ -0,0 +1,121 @@
+""" Pruning of rides between consecutive degrees of extension """
+from collections import defaultdict
+
+import numpy as np
+
+from algorithm.feasibility_utils.ride_table import RideTable
+
+PRUNING_MODES = ['strict', 'safe', 'dominance']
+
+
+def prune_rides(
+        rides: RideTable,
+        mode: str = 'strict',
+        extend: bool = True
+) -> (RideTable, RideTable):
+    """
+    Prune rides of a single degree.
+    'strict': all rides are kept and extended (exact).
+    'safe': one ride per (origin order, destination order) signature,
+    orderings dominated by another ordering of the same travellers are
+    dropped from the output, and only rides whose travellers can be
+    part of an extension are extended. Extensions are unchanged, since
+    every sub-ride of an extension must be attractive (see candidate_extensions).
+    'dominance': as 'safe', but dominated orderings are not extended either.
+    Fewer extensions are evaluated, but an attractive extension whose
+    restriction is a dominated ordering is lost (not exact).
+    :param rides: attractive rides of degree k
+    :param mode: one of PRUNING_MODES
+    :param extend: if False, the rides are not to be extended (no frontier)
+    :return: rides to report and rides to extend (frontier)
+    """
+    assert mode in PRUNING_MODES, f"Pruning mode must be one of {PRUNING_MODES}"
+    if mode == 'strict' or not len(rides):
+        return rides, rides
+
+    rides = unique_signatures(rides)
+    kept = rides.take(~dominated_orderings(rides))
+    if not extend:
+        return kept, RideTable.empty(rides.degree)
+    frontier = kept if mode == 'dominance' else rides
+    return kept, frontier.take(extendable(frontier))
+
+
+def unique_signatures(
+        rides: RideTable
+) -> RideTable:
+    """ Sort rides by their orders and drop duplicates, so output is deterministic """
+    if not len(rides):
+        return rides
+    keys = np.hstack([rides.origin_order, rides.destination_order])
+    _, first = np.unique(keys, axis=0, return_index=True)
+    return rides.take(first)
+
+
+def dominated_orderings(
+        rides: RideTable
+) -> np.ndarray:
+    """
+    Rides for which another ride of the same travellers is at least as
+    good for every traveller and at most as long, and better in one of these
+    :param rides: rides of a single degree
+    :return: boolean mask of dominated rides
+    """
+    # Utilities aligned by traveller (columns in order of ids)
+    by_traveller = np.argsort(rides.ids, axis=1)
+    travellers = np.take_along_axis(rides.ids, by_traveller, axis=1)
+    utilities = np.take_along_axis(rides.u_traveller_individual, by_traveller, axis=1)
+
+    # Groups of rides of the same travellers
+    _, group, sizes = np.unique(travellers, axis=0, return_inverse=True, return_counts=True)
+    group = group.ravel()
+    order = np.argsort(group, kind='stable')
+    starts = np.cumsum(sizes) - sizes
+
+    # All ordered pairs (a, b) of different rides within a group
+    counts = sizes[group]
+    first = np.repeat(np.arange(len(group)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = order[np.repeat(starts[group], counts) + offsets]
+    different = first != second
+    first, second = first[different], second[different]
+
+    at_least = (utilities[first] >= utilities[second]).all(axis=1) & \
+               (rides.veh_distance[first] <= rides.veh_distance[second])
+    better = (utilities[first] > utilities[second]).any(axis=1) | \
+             (rides.veh_distance[first] < rides.veh_distance[second])
+    dominated = np.zeros(len(rides), dtype=bool)
+    dominated[second[at_least & better]] = True
+    return dominated
+
+
+def extendable(
+        rides: RideTable
+) -> np.ndarray:
+    """
+    Rides of degree k whose travellers R can be part of a ride of degree k+1:
+    there must be a traveller t such that for every member m,
+    R - {m} + {t} are travellers of some ride of degree k.
+    :param rides: rides of a single degree
+    :return: boolean mask of rides which may be extended
+    """
+    travellers = [tuple(t) for t in np.sort(rides.ids, axis=1).tolist()]
+    sets = set(travellers)
+
+    # Travellers t completing a set of k-1 travellers to a set of k travellers
+    completions = defaultdict(set)
+    for members in sets:
+        for traveller in members:
+            completions[tuple(m for m in members if m != traveller)].add(traveller)
+
+    possible = {}
+    for members in sets:
+        common = None
+        for traveller in members:
+            candidates = completions[tuple(m for m in members if m != traveller)]
+            common = set(candidates) if common is None else common & candidates
+            if not common:
+                break
+        possible[members] = bool(common)
+
+    return np.array([possible[members] for members in travellers], dtype=bool)
@@ -0,0 +1,79 @@
+""" Prepared requests as typed arrays, gathered by traveller position """
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+import pandas as pd
+
+INTEGER_COLUMNS = ['traveller_id', 'origin', 'destination', 't_ns', 't_req_int']
+
+
+@dataclass
+class RequestTable:
+    """
+    Columns of prepared requests (see prepare_requests) as NumPy arrays,
+    one entry per request. Characteristics of travellers of many rides
+    are gathered at once by indexing with positions (see positions).
+    """
+    traveller_id: np.ndarray
+    origin: np.ndarray
+    destination: np.ndarray
+    t_ns: np.ndarray
+    t_req_int: np.ndarray
+    distance: np.ndarray
+    VoT: np.ndarray
+    WtS: np.ndarray
+    max_delay: np.ndarray
+    u_ns: np.ndarray
+    ASC_pool: np.ndarray
+    _id_order: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        for column in self.columns():
+            dtype = np.int64 if column in INTEGER_COLUMNS else np.float64
+            setattr(self, column, np.ascontiguousarray(getattr(self, column), dtype=dtype))
+        self._id_order = np.argsort(self.traveller_id, kind='stable')
+
+    @classmethod
+    def columns(cls) -> list:
+        return [f.name for f in fields(cls) if f.init]
+
+    @classmethod
+    def from_requests(
+            cls,
+            requests
+    ):
+        """ Table of prepared requests (dataframe), tables are returned as they are """
+        if isinstance(requests, cls):
+            return requests
+        return cls(**{column: requests[column].to_numpy() for column in cls.columns()})
+
+    def __len__(self) -> int:
+        return len(self.traveller_id)
+
+    def take(
+            self,
+            positions: np.ndarray
+    ):
+        """ Table of the requests at the given positions """
+        return type(self)(**{column: values[positions] for column, values in self.to_dict().items()})
+
+    def to_dict(self) -> dict:
+        """ Column name -> array, e.g. to place the table in shared memory """
+        return {column: getattr(self, column) for column in self.columns()}
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.to_dict())
+
+    def positions(
+            self,
+            traveller_ids: np.ndarray
+    ) -> np.ndarray:
+        """ Positions of travellers in the table, same shape as traveller_ids """
+        traveller_ids = np.asarray(traveller_ids)
+        if not traveller_ids.size:
+            return np.zeros(traveller_ids.shape, dtype=np.int64)
+        sorted_ids = self.traveller_id[self._id_order]
+        found = np.searchsorted(sorted_ids, traveller_ids).clip(max=len(self) - 1)
+        if not len(self) or (sorted_ids[found] != traveller_ids).any():
+            raise KeyError("Unknown traveller ids")
+        return self._id_order[found]
@@ -0,0 +1,144 @@
+""" Compact, struct-of-arrays storage of rides of a single degree """
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from algorithm.feasibility_utils.miscellaneous import ride_output_columns
+
+ID_TYPE = np.int32
+VALUE_TYPE = np.float32
+KIND_TYPE = np.int16
+
+
+@dataclass
+class RideTable:
+    """
+    Rides of degree k stored as fixed-width arrays, one row per ride:
+    ids, origin_order, destination_order (int32, n x k),
+    delays, u_traveller_individual (float32, n x k),
+    kind (int16), veh_distance and t_travel (float32, n).
+    Order of columns in delays and u_traveller_individual
+    follows ids.
+    """
+    ids: np.ndarray
+    origin_order: np.ndarray
+    destination_order: np.ndarray
+    delays: np.ndarray
+    u_traveller_individual: np.ndarray
+    kind: np.ndarray
+    veh_distance: np.ndarray
+    t_travel: np.ndarray
+
+    def __post_init__(self):
+        for name in ['ids', 'origin_order', 'destination_order']:
+            values = np.asarray(getattr(self, name))
+            assert values.size == 0 or np.abs(values).max() <= np.iinfo(ID_TYPE).max, \
+                "Traveller ids exceed the range of int32"
+            setattr(self, name, np.atleast_2d(values.astype(ID_TYPE, copy=False)))
+        for name in ['delays', 'u_traveller_individual']:
+            setattr(self, name, np.atleast_2d(np.asarray(getattr(self, name)).astype(VALUE_TYPE, copy=False)))
+        self.kind = np.broadcast_to(np.asarray(self.kind, dtype=KIND_TYPE), (len(self.ids),)).copy()
+        self.veh_distance = np.asarray(self.veh_distance).astype(VALUE_TYPE, copy=False)
+        self.t_travel = np.asarray(self.t_travel).astype(VALUE_TYPE, copy=False)
+
+    @classmethod
+    def empty(
+            cls,
+            degree: int
+    ):
+        """ Table without rides """
+        return cls(
+            ids=np.empty((0, degree)),
+            origin_order=np.empty((0, degree)),
+            destination_order=np.empty((0, degree)),
+            delays=np.empty((0, degree)),
+            u_traveller_individual=np.empty((0, degree)),
+            kind=np.empty(0),
+            veh_distance=np.empty(0),
+            t_travel=np.empty(0)
+        )
+
+    @classmethod
+    def concat(
+            cls,
+            tables: list
+    ):
+        """ Concatenate tables of the same degree """
+        assert tables, "No tables to concatenate"
+        assert len(set(t.degree for t in tables)) == 1, "Tables of different degrees"
+        return cls(**{
+            name: np.concatenate([getattr(t, name) for t in tables])
+            for name in cls.__dataclass_fields__
+        })
+
+    @property
+    def degree(self) -> int:
+        return self.ids.shape[1]
+
+    @property
+    def u_traveller_total(self) -> np.ndarray:
+        return self.u_traveller_individual.sum(axis=1, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(
+            self,
+            selection: np.ndarray
+    ):
+        """ Subset of rides given a boolean mask or positions """
+        return RideTable(**{
+            name: getattr(self, name)[selection]
+            for name in self.__dataclass_fields__
+        })
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__dataclass_fields__)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Convert to the ride_output_columns() format. Scalar columns
+        are not copied, list-valued columns hold views on the rows.
+        """
+        out = pd.DataFrame({
+            'ids': list(self.ids),
+            'u_traveller_total': self.u_traveller_total,
+            'u_traveller_individual': list(self.u_traveller_individual),
+            'veh_distance': self.veh_distance,
+            'kind': self.kind,
+            't_travel': self.t_travel,
+            'delays': list(self.delays),
+            'origin_order': list(self.origin_order),
+            'destination_order': list(self.destination_order)
+        }, copy=False)
+        return out[ride_output_columns()]
+
+    def to_arrow(self) -> pa.Table:
+        """ Columnar (Arrow) form, matrices are split into columns name_0 ... name_k-1 """
+        columns = {}
+        for name in self.__dataclass_fields__:
+            values = getattr(self, name)
+            if values.ndim == 1:
+                columns[name] = values
+            else:
+                columns.update({f'{name}_{num}': values[:, num] for num in range(values.shape[1])})
+        return pa.table(columns)
+
+    @classmethod
+    def from_arrow(
+            cls,
+            table: pa.Table
+    ):
+        """ Inverse of to_arrow """
+        degree = sum(name.startswith('ids_') for name in table.column_names)
+        columns = {}
+        for name in cls.__dataclass_fields__:
+            if name in table.column_names:
+                columns[name] = table.column(name).to_numpy()
+            else:
+                columns[name] = np.column_stack(
+                    [table.column(f'{name}_{num}').to_numpy() for num in range(degree)]
+                ) if len(table) else np.empty((0, degree))
+        return cls(**columns)
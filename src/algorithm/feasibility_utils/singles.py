@@ -1,21 +1,22 @@
+import numpy as np
 import pandas as pd
 
 from algorithm.feasibility_utils.pooltype import PoolType
+from algorithm.feasibility_utils.ride_table import RideTable
 
 
 def single_rides(
         requests: pd.DataFrame
-):
+) -> RideTable:
     """ Assume that private rides are always feasible """
-    output = requests.copy()
-    output['ids'] = output['traveller_id'].apply(lambda x: [x])
-    output['u_traveller_total'] = output['u_ns']
-    output['u_traveller_individual'] = output['u_ns'].apply(lambda x: [x])
-    output['veh_distance'] = output['distance']
-    output['kind'] = PoolType.SINGLE
-    output['t_travel'] = output['t_ns'].apply(lambda x: [x])
-    output['delays'] = [[0]]*len(output)
-    output['origin_order'] = output['traveller_id'].apply(lambda x: [x])
-    output['destination_order'] = output['origin_order']
-
-    return output.copy()
+    traveller_ids = requests['traveller_id'].to_numpy()[:, None]
+    return RideTable(
+        ids=traveller_ids,
+        origin_order=traveller_ids,
+        destination_order=traveller_ids,
+        delays=np.zeros((len(requests), 1)),
+        u_traveller_individual=requests['u_ns'].to_numpy()[:, None],
+        kind=PoolType.SINGLE,
+        veh_distance=requests['distance'].to_numpy(),
+        t_travel=requests['t_ns'].to_numpy()
+    )
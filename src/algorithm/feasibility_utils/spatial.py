@@ -0,0 +1,116 @@
+""" Lower bounds of distances from a landmark embedding of the skim """
+import numpy as np
+
+from algorithm.feasibility_utils.request_table import RequestTable
+from utilities.skim import Skim
+
+# Slack (in units of the skim) for rounding errors of differences of distances
+BOUND_TOLERANCE = 1e-6
+
+
+def landmark_embedding(
+        skim_matrix: Skim,
+        nodes: np.ndarray,
+        landmarks: int = 8
+) -> np.ndarray:
+    """
+    Distances from landmarks to the nodes. Landmarks are chosen among
+    the nodes by farthest-point selection, starting from the first node.
+    Only rows of the landmarks are read from the skim.
+    :param skim_matrix: skim with distances between nodes
+    :param nodes: unique node ids
+    :param landmarks: number of landmarks
+    :return: embedding (n x landmarks)
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    embedding = np.zeros((len(nodes), landmarks))
+    if not len(nodes):
+        return embedding
+    closest = np.full(len(nodes), np.inf)
+    landmark = nodes[0]
+    for num in range(landmarks):
+        distances = skim_matrix[np.full(len(nodes), landmark), nodes]
+        embedding[:, num] = distances
+        closest = np.minimum(closest, distances)
+        landmark = nodes[np.argmax(np.where(np.isfinite(closest), closest, -1))]
+    return embedding
+
+
+def distance_bound(
+        embedding: np.ndarray,
+        source: np.ndarray,
+        target: np.ndarray
+) -> np.ndarray:
+    """
+    Lower bound of distances from sources to targets given the landmark
+    embedding: d(L, b) <= d(L, a) + d(a, b) for every landmark L
+    (triangle inequality of shortest paths, also in directed graphs)
+    :param embedding: landmark embedding (see landmark_embedding)
+    :param source: rows of the embedding of sources
+    :param target: rows of the embedding of targets
+    :return: lower bounds
+    """
+    bound = np.zeros(len(source))
+    with np.errstate(invalid='ignore'):
+        for landmark in range(embedding.shape[1]):
+            distances = embedding[:, landmark]
+            # Unreachable nodes (inf - inf) give no bound
+            bound = np.fmax(bound, distances[target] - distances[source])
+    return np.maximum(bound - BOUND_TOLERANCE, 0)
+
+
+def route_bounds(
+        embedding: np.ndarray,
+        route: np.ndarray
+) -> np.ndarray:
+    """
+    Lower bounds of legs of routes (see distance_bound), landmark
+    by landmark to keep the memory at the size of the routes
+    :param embedding: landmark embedding of the stops
+    :param route: rows of the embedding of consecutive stops (n x stops)
+    :return: lower bounds of legs (n x stops - 1)
+    """
+    bound = np.zeros((len(route), max(route.shape[1] - 1, 0)))
+    with np.errstate(invalid='ignore'):
+        for distances in np.ascontiguousarray(embedding.T):
+            distances = distances[route]
+            np.fmax(bound, distances[:, 1:] - distances[:, :-1], out=bound)
+    return np.maximum(bound - BOUND_TOLERANCE, 0)
+
+
+def spatially_compatible(
+        pos_i: np.ndarray,
+        pos_j: np.ndarray,
+        requests: RequestTable,
+        embedding: np.ndarray,
+        nodes: np.ndarray,
+        params: dict
+) -> np.ndarray:
+    """
+    Pairs which may pass the origin compatibility and (if set) the
+    dist_threshold filters, judging by lower bounds of distances.
+    The 2nd origin has to be reached within the time windows:
+    t_oo <= t_req_int_j - t_req_int_i + max_delay_i + max_delay_j.
+    :param pos_i: positions (in requests) of the first travellers
+    :param pos_j: positions (in requests) of the second travellers
+    :param requests: table of requests
+    :param embedding: landmark embedding of the nodes
+    :param nodes: sorted node ids of rows of the embedding,
+    including origins and destinations of the travellers
+    :param params: speed and optionally dist_threshold
+    :return: boolean mask of pairs to keep
+    """
+    # Rows of the embedding by request (requests outside the pairs are never used)
+    origins = np.searchsorted(nodes, requests.origin).clip(max=len(nodes) - 1)
+    origin_bound = distance_bound(embedding, origins[pos_i], origins[pos_j])
+
+    slack = requests.t_req_int[pos_j] - requests.t_req_int[pos_i] + \
+        requests.max_delay[pos_i] + requests.max_delay[pos_j]
+    compatible = np.floor(origin_bound / params['speed']) <= slack
+
+    if params.get('dist_threshold'):
+        destinations = np.searchsorted(nodes, requests.destination).clip(max=len(nodes) - 1)
+        destination_bound = distance_bound(embedding, destinations[pos_i], destinations[pos_j])
+        compatible &= (origin_bound <= params['dist_threshold']) & \
+            (destination_bound <= params['dist_threshold'])
+    return compatible
@@ -1,21 +1,57 @@
 """ Functions to calculate utility - (un)attractiveness
 of shared rides """
-import pandas as pd
+import numpy as np
+
+from algorithm.feasibility_utils.request_table import RequestTable
 
 
 def utility_pairs(
-        ride_row: pd.Series,
-        i_j: str,
-        fifo_lifo: str,
+        travellers: np.ndarray,
+        travel_times: np.ndarray,
+        delays: np.ndarray,
+        requests: RequestTable,
         params: dict
-):
-    """ Utility of a shared ride """
-    out = -params['price'] * ride_row['distance'] / 1000 * (1 - params['share_discount'])
-    out -= ride_row['VoT'] * (ride_row['t_s_' + i_j + '_' + fifo_lifo] * ride_row['WtS'])
-    out -= ride_row['VoT'] * ride_row['delay_' + i_j] * \
-           ride_row['VoT'] * params.get('delay_value')
-    out -= ride_row['ASC_pool_' + i_j]
-    return out
+) -> np.ndarray:
+    """
+    Utilities of shared rides of degree two, FIFO and LIFO at once
+    :param travellers: positions (in requests) of travellers i and j (n x 2)
+    :param travel_times: in-vehicle times of i and j in FIFO and LIFO rides (n x 2 x 2)
+    :param delays: delays of i and j (n x 2)
+    :param requests: table of requests
+    :param params: parameters of the simulation
+    :return: utilities of i and j in FIFO and LIFO rides (n x 2 x 2)
+    """
+    return shared_utilities(
+        travellers=travellers[:, None, :],
+        travel_time=travel_times,
+        delay=delays[:, None, :],
+        requests=requests,
+        params=params
+    )
+
+
+def shared_utilities(
+        travellers: np.ndarray,
+        travel_time: np.ndarray,
+        delay: np.ndarray,
+        requests: RequestTable,
+        params: dict
+) -> np.ndarray:
+    """
+    Utilities of travellers of many shared rides in a single call,
+    characteristics of travellers are gathered from the request table
+    :param travellers: positions of travellers in requests (any shape)
+    :param travel_time: in-vehicle time of each traveller (broadcast with travellers)
+    :param delay: delay of each traveller, sign is ignored
+    :param requests: table of requests
+    :param params: parameters of the simulation
+    :return: utilities of the travellers
+    """
+    vot = requests.VoT[travellers]
+    out = -params['price'] * requests.distance[travellers] / 1000 * (1 - params['share_discount'])
+    out = out - vot * travel_time * requests.WtS[travellers]
+    out = out - vot * np.abs(delay) * params['delay_value']
+    return out - requests.ASC_pool[travellers]
 
 
 def utility_shared(
@@ -0,0 +1,344 @@
+""" Matching of travellers to attractive rides (set partitioning) """
+import time
+from dataclasses import dataclass
+from logging import Logger
+
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import shareability_output
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+
+MATCHING_METHODS = ['auto', 'greedy', 'exact']
+MATCHING_OBJECTIVES = ['veh_distance', 'utility']
+# Savings below the tolerance are not worth sharing a ride
+SAVING_TOLERANCE = 1e-9
+
+
+@dataclass
+class Incidence:
+    """
+    Sparse (CSR) ride x traveller incidence matrix: travellers of ride r
+    are columns indices[indptr[r]:indptr[r + 1]], which are positions
+    of travellers in traveller_ids. Rides follow the order of
+    shareability_output (consecutive degrees).
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+    traveller_ids: np.ndarray
+
+    @classmethod
+    def from_rides(
+            cls,
+            rides_by_degree: dict
+    ):
+        """ Incidence of rides by degree (RideTable), without the list-valued output """
+        traveller_ids = np.unique(np.concatenate(
+            [rides.ids.ravel() for rides in rides_by_degree.values()])).astype(np.int64)
+        sizes = np.concatenate([np.full(len(rides), rides.degree) for rides in rides_by_degree.values()])
+        indptr = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        indices = np.concatenate([np.searchsorted(traveller_ids, rides.ids.ravel())
+                                  for rides in rides_by_degree.values()]).astype(np.int64)
+        return cls(indptr, indices, traveller_ids)
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.indptr) - 1, len(self.traveller_ids)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """ Number of travellers of each ride """
+        return np.diff(self.indptr)
+
+    def entry_rides(self) -> np.ndarray:
+        """ Ride (row) of each entry """
+        return np.repeat(np.arange(self.shape[0]), self.sizes)
+
+    def to_scipy(self):
+        """ scipy.sparse.csr_matrix of the incidence """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((np.ones(len(self.indices)), self.indices, self.indptr), shape=self.shape)
+
+
+def match_rides(
+        rides_by_degree: dict,
+        objective: str = 'veh_distance',
+        method: str = 'auto',
+        exact_limit: int = 100000,
+        local_search_passes: int = 0,
+        time_limit: float | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None
+) -> dict:
+    """
+    Assign each traveller to exactly one ride, so that the total cost is minimal.
+    Singles (degree 1) must be included, hence a matching always exists.
+    :param rides_by_degree: attractive rides, dictionary degree -> RideTable
+    :param objective: 'veh_distance' (minimise vehicle distance) or
+    'utility' (maximise total utility of travellers)
+    :param method: 'greedy' (with local search, for large instances), 'exact'
+    (set partitioning with the HiGHS MIP solver of scipy) or 'auto'
+    (exact up to exact_limit rides)
+    :param exact_limit: maximal number of rides solved exactly with 'auto'
+    :param local_search_passes: maximal number of improvement passes after greedy
+    (by default none, local search is slow on large instances)
+    :param time_limit: time limit in seconds of the exact solver or of the local search
+    :param logger: for logging purposes
+    :param metrics: if passed, collects statistics of the 'matching' stage
+    :return: dictionary with indices of selected rides in the shareability_output
+    ('selected'), their dataframe ('schedule'), value of the objective
+    (total cost of the selected rides, 'objective'), 'method', 'status'
+    and 'solve_time' in seconds (with building the incidence matrix)
+    """
+    assert method in MATCHING_METHODS, f"Matching method must be one of {MATCHING_METHODS}"
+    assert objective in MATCHING_OBJECTIVES, f"Objective must be one of {MATCHING_OBJECTIVES}"
+    assert 1 in rides_by_degree, "Single rides are required for the matching"
+    metrics = Metrics() if metrics is None else metrics
+    start = time.perf_counter()
+
+    with metrics.stage('matching'):
+        incidence = Incidence.from_rides(rides_by_degree)
+        cost = ride_costs(rides_by_degree, objective)
+        if method == 'auto':
+            method = 'exact' if incidence.shape[0] <= exact_limit else 'greedy'
+
+        if method == 'exact':
+            selected, status = exact_matching(incidence, cost, time_limit)
+        else:
+            selected = greedy_matching(incidence, cost, local_search_passes, time_limit)
+            status = 'feasible'
+        selected = np.flatnonzero(selected)
+    solve_time = time.perf_counter() - start
+    metrics.count('matching', 'selected', len(selected))
+    objective_value = float(cost[selected].sum())
+
+    optional_log(20, f"Matching ({method}, {status}) of {incidence.shape[1]} travellers to "
+                     f"{len(selected)} of {incidence.shape[0]} rides, objective "
+                     f"{objective_value:.2f} in {solve_time:.3f}s", logger)
+    schedule = shareability_output(selected_rides(rides_by_degree, selected))
+    return {
+        'selected': selected,
+        'schedule': schedule,
+        'objective': objective_value,
+        'method': method,
+        'status': status,
+        'solve_time': solve_time
+    }
+
+
+def selected_rides(
+        rides_by_degree: dict,
+        selected: np.ndarray
+) -> dict:
+    """
+    Rides at positions (in order of shareability_output, sorted) by degree
+    :return: dictionary degree -> RideTable of the selected rides
+    """
+    bounds = np.cumsum([0] + [len(rides) for rides in rides_by_degree.values()])
+    return {degree: rides.take(selected[(selected >= start) & (selected < end)] - start)
+            for (degree, rides), start, end in zip(rides_by_degree.items(), bounds[:-1], bounds[1:])}
+
+
+def ride_costs(
+        rides_by_degree: dict,
+        objective: str
+) -> np.ndarray:
+    """ Cost of each ride (in order of shareability_output) to be minimised """
+    if objective == 'veh_distance':
+        return np.concatenate([rides.veh_distance for rides in rides_by_degree.values()]).astype(np.float64)
+    return -np.concatenate([rides.u_traveller_total for rides in rides_by_degree.values()])
+
+
+def savings(
+        incidence: Incidence,
+        cost: np.ndarray
+) -> (np.ndarray, np.ndarray):
+    """
+    Savings of rides with respect to single rides of their travellers
+    :return: savings of rides and the single ride of each traveller
+    """
+    single = incidence.sizes == 1
+    single_ride = np.empty(incidence.shape[1], dtype=np.int64)
+    single_ride[incidence.indices[incidence.indptr[:-1][single]]] = np.flatnonzero(single)
+    single_cost = np.bincount(incidence.entry_rides(), weights=cost[single_ride][incidence.indices],
+                              minlength=incidence.shape[0])
+    return single_cost - cost, single_ride
+
+
+def greedy_matching(
+        incidence: Incidence,
+        cost: np.ndarray,
+        local_search_passes: int = 0,
+        time_limit: float | None = None
+) -> np.ndarray:
+    """
+    Greedy matching by savings (see savings), optionally followed by a local search.
+    Equivalent to taking rides one by one in order of decreasing savings
+    if none of their travellers is matched yet, but evaluated in rounds:
+    a ride is taken when it has the highest priority among remaining
+    rides of each of its travellers. Unmatched travellers ride alone.
+    :param incidence: ride x traveller incidence
+    :param cost: cost of each ride
+    :param local_search_passes: maximal number of passes of local_search
+    :param time_limit: time limit of local_search in seconds
+    :return: boolean mask of selected rides
+    """
+    n_rides, n_travellers = incidence.shape
+    saving, single_ride = savings(incidence, cost)
+    entry_rides = incidence.entry_rides()
+    sizes = incidence.sizes
+
+    # Priority: higher savings first, ties by position
+    rank = np.empty(n_rides, dtype=np.int64)
+    rank[np.lexsort((np.arange(n_rides), -saving))] = np.arange(n_rides)
+
+    selected = np.zeros(n_rides, dtype=bool)
+    active = (saving > SAVING_TOLERANCE) & (sizes > 1)
+    entries = np.flatnonzero(active[entry_rides])
+    while len(entries):
+        rides, travellers = entry_rides[entries], incidence.indices[entries]
+        best = np.full(n_travellers, n_rides, dtype=np.int64)
+        np.minimum.at(best, travellers, rank[rides])
+        wins = np.bincount(rides[best[travellers] == rank[rides]], minlength=n_rides)
+        taken = wins == sizes
+        selected |= taken
+
+        # Rides of matched travellers are no longer available
+        matched = np.zeros(n_travellers, dtype=bool)
+        matched[travellers[taken[rides]]] = True
+        blocked = np.bincount(rides, weights=matched[travellers], minlength=n_rides) > 0
+        entries = entries[~blocked[rides]]
+
+    if local_search_passes:
+        selected = local_search(incidence, saving, selected, local_search_passes, time_limit)
+
+    covered = np.zeros(n_travellers, dtype=bool)
+    covered[incidence.indices[selected[entry_rides]]] = True
+    selected[single_ride[~covered]] = True
+    return selected
+
+
+def local_search(
+        incidence: Incidence,
+        saving: np.ndarray,
+        selected: np.ndarray,
+        passes: int = 5,
+        time_limit: float | None = None
+) -> np.ndarray:
+    """
+    Improve a matching by repacking: a selected shared ride is dropped
+    and its travellers, together with unmatched travellers, are packed
+    greedily into other rides including at least one of them. The move
+    is kept if the packed rides save more than the dropped one.
+    Greedy by savings leaves no ride to add without dropping another,
+    hence single replacements alone do not improve it.
+    :param incidence: ride x traveller incidence
+    :param saving: savings of rides (see savings)
+    :param selected: boolean mask of selected shared rides
+    :param passes: maximal number of passes over selected rides
+    :param time_limit: the search stops (keeping moves made) after this many seconds
+    :return: improved mask of selected shared rides
+    """
+    n_rides, n_travellers = incidence.shape
+    entry_rides = incidence.entry_rides()
+    ride_sizes = incidence.sizes
+    selected = selected.copy()
+    deadline = np.inf if time_limit is None else time.perf_counter() + time_limit
+
+    # Transposed incidence: rides of each traveller (with positive savings)
+    positive = saving[entry_rides] > SAVING_TOLERANCE
+    order = np.argsort(incidence.indices[positive], kind='stable')
+    traveller_rides = entry_rides[positive][order]
+    traveller_ptr = np.concatenate([[0], np.cumsum(np.bincount(
+        incidence.indices[positive], minlength=n_travellers))])
+
+    assigned = np.full(n_travellers, -1, dtype=np.int64)
+    assigned[incidence.indices[selected[entry_rides]]] = entry_rides[selected[entry_rides]]
+
+    def members(ride):
+        return incidence.indices[incidence.indptr[ride]:incidence.indptr[ride + 1]]
+
+    for _ in range(passes):
+        improved = False
+        dropped_rides = np.flatnonzero(selected)
+        for dropped in dropped_rides[np.argsort(saving[dropped_rides], kind='stable')].tolist():
+            if time.perf_counter() > deadline:
+                return selected
+            if not selected[dropped]:
+                continue
+            freed = members(dropped)
+            candidates = np.unique(np.concatenate(
+                [traveller_rides[traveller_ptr[t]:traveller_ptr[t + 1]] for t in freed.tolist()]))
+            candidates = candidates[candidates != dropped]
+            if not len(candidates):
+                continue
+
+            # Candidates with all travellers unmatched or freed
+            sizes = ride_sizes[candidates]
+            offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            entries = np.repeat(incidence.indptr[candidates], sizes) + offsets
+            owner = assigned[incidence.indices[entries]]
+            taken = np.bincount(np.repeat(np.arange(len(candidates)), sizes),
+                                weights=(owner != -1) & (owner != dropped), minlength=len(candidates))
+            candidates = candidates[taken == 0]
+            candidates = candidates[np.argsort(-saving[candidates], kind='stable')]
+
+            packed, used, total = [], set(), 0.
+            for ride in candidates.tolist():
+                travellers = set(members(ride).tolist())
+                if not travellers & used:
+                    packed.append(ride)
+                    used |= travellers
+                    total += saving[ride]
+            if total <= saving[dropped] + SAVING_TOLERANCE:
+                continue
+
+            selected[dropped] = False
+            assigned[freed] = -1
+            for ride in packed:
+                selected[ride] = True
+                assigned[members(ride)] = ride
+            improved = True
+        if not improved:
+            break
+    return selected
+
+
+def exact_matching(
+        incidence: Incidence,
+        cost: np.ndarray,
+        time_limit: float | None = None
+) -> (np.ndarray, str):
+    """
+    Optimal set partitioning: each traveller in exactly one selected ride,
+    solved with HiGHS (scipy.optimize.milp)
+    :param incidence: ride x traveller incidence
+    :param cost: cost of each ride
+    :param time_limit: time limit in seconds, the best found matching is returned
+    :return: boolean mask of selected rides and status of the solver
+    """
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    result = milp(
+        c=cost,
+        constraints=LinearConstraint(incidence.to_scipy().T.tocsr(), lb=1, ub=1),
+        integrality=np.ones(len(cost)),
+        bounds=Bounds(0, 1),
+        options={} if time_limit is None else {'time_limit': time_limit}
+    )
+    assert result.x is not None, f"No matching found: {result.message}"
+    status = 'optimal' if result.status == 0 else result.message
+    return result.x > 0.5, status
+
+
+def schedule_travellers(
+        matching: dict
+) -> pd.DataFrame:
+    """ Traveller -> index of the selected ride in the schedule """
+    schedule = matching['schedule']
+    sizes = schedule['ids'].map(len).to_numpy()
+    return pd.DataFrame({
+        'traveller_id': np.concatenate(schedule['ids'].to_numpy()) if len(schedule) else [],
+        'ride': np.repeat(np.arange(len(schedule)), sizes)
+    })
@@ -0,0 +1,195 @@
+""" Attractive rides for many behavioural scenarios on the same demand and city """
+import json
+from dataclasses import replace
+from itertools import product
+from logging import Logger
+
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import prepare_requests, shareability_output
+from algorithm.feasibility_utils.singles import single_rides
+from algorithm.feasibility_utils.pairs import pair_geometry, scenario_pairs, attractive_pairs
+from algorithm.feasibility_utils.high_order_rides_v02 import candidate_extensions, ride_geometry, \
+    ride_signatures, select_attractive, sub_ride_positions
+from algorithm.feasibility_utils.pruning import prune_rides, unique_signatures
+from algorithm.feasibility_utils.request_table import RequestTable
+from algorithm.feasibility_utils.ride_table import RideTable
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
+
+# Parameters which determine the geometry, hence must be equal in all scenarios
+GEOMETRIC_PARAMETERS = ['speed', 'horizon', 'dist_threshold', 'spatial_landmarks']
+
+
+def scenario_grid(
+        **values: list
+) -> list:
+    """
+    All combinations of parameter values, e.g.
+    scenario_grid(price=[1, 1.5], behaviour=['configs/behaviour/a.json'])
+    :return: list of scenarios (parameter overrides)
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in product(*values.values())]
+
+
+def _scenario_parameters(
+        parameters: dict,
+        scenario: dict
+) -> dict:
+    """ Parameters of a scenario, 'behaviour' (path to a .json) is loaded """
+    scenario = dict(scenario)
+    behaviour = {}
+    if 'behaviour' in scenario:
+        with open(scenario.pop('behaviour'), encoding='utf-8') as json_file:
+            behaviour = json.load(json_file)
+    return {**parameters, **behaviour, **scenario}
+
+
+def parameter_sweep(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        scenarios: list,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None
+) -> list:
+    """
+    Attractive rides (as attractive_rides) for each scenario. Candidates and
+    their geometry (travel times of pairs, routes of rides of higher degree)
+    are computed once and only delays, utilities and attractiveness
+    are evaluated for each scenario.
+    :param requests: requests, see attractive_rides
+    :param skim_matrix: skim with distances between nodes
+    :param parameters: common parameters, see attractive_rides
+    :param scenarios: parameter overrides (e.g. VoT, WtS, price, share_discount,
+    delay_value, max_degree or 'behaviour': path to a behaviour .json),
+    parameters in GEOMETRIC_PARAMETERS must not change
+    :param travellers_characteristics: see attractive_rides
+    :param logger: for logging purposes
+    :param metrics: statistics of stages, summed over scenarios
+    :return: dataframe of rides for each scenario
+    """
+    return [shareability_output(rides) for rides in sweep_rides(
+        requests=requests,
+        skim_matrix=skim_matrix,
+        parameters=parameters,
+        scenarios=scenarios,
+        travellers_characteristics=travellers_characteristics,
+        logger=logger,
+        metrics=metrics
+    )]
+
+
+def sweep_rides(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        scenarios: list,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None
+) -> list:
+    """
+    Rides by degree for each scenario, see parameter_sweep
+    :return: list (by scenario) of dictionaries degree -> RideTable
+    """
+    metrics = Metrics() if metrics is None else metrics
+    scenario_params = [_scenario_parameters(parameters, scenario) for scenario in scenarios]
+    for params in scenario_params:
+        if any(params.get(name) != parameters.get(name) for name in GEOMETRIC_PARAMETERS):
+            raise ValueError(f"Scenarios cannot change {GEOMETRIC_PARAMETERS}")
+
+    # Requests of each scenario, in the same order
+    prepared, tables = [], []
+    with metrics.stage('preprocessing'):
+        for params in scenario_params:
+            scenario_requests = prepare_requests(
+                requests=requests.copy(),
+                skim_matrix=skim_matrix,
+                parameters=params,
+                travellers_characteristics=travellers_characteristics,
+                logger=logger
+            )
+            table = RequestTable.from_requests(scenario_requests)
+            if tables:
+                table = table.take(table.positions(tables[0].traveller_id))
+            prepared.append(scenario_requests)
+            tables.append(table)
+
+    with metrics.stage('single_rides'):
+        rides = [{1: single_rides(scenario_requests)} for scenario_requests in prepared]
+
+    # Geometry of pairs with the loosest time windows across scenarios
+    active = [num for num, params in enumerate(scenario_params) if params['max_degree'] > 1]
+    if not active:
+        return rides
+    loose = replace(tables[0], max_delay=np.max([tables[num].max_delay for num in active], axis=0))
+    with metrics.stage('pair_filters'):
+        geometry = pair_geometry(
+            requests=loose,
+            params=parameters,
+            skim_matrix=skim_matrix,
+            logger=logger,
+            metrics=metrics
+        )
+    optional_log(20, f"Pair geometry computed for {len(scenarios)} scenarios", logger)
+
+    with metrics.stage('pair_utilities'):
+        for num in active:
+            rides[num][2] = attractive_pairs(
+                pairs=scenario_pairs(geometry, tables[num], scenario_params[num], logger, metrics),
+                requests=tables[num],
+                params=scenario_params[num],
+                logger=logger,
+                metrics=metrics
+            )
+
+    # Extend the union of frontiers of scenarios, evaluate each scenario on its candidates
+    current_degree = 2
+    while active:
+        frontiers = {}
+        with metrics.stage('pruning'):
+            for num in active:
+                rides[num][current_degree], frontiers[num] = prune_rides(
+                    rides=rides[num][current_degree],
+                    mode=scenario_params[num].get('frontier_pruning', 'strict'),
+                    extend=current_degree < scenario_params[num]['max_degree']
+                )
+        active = [num for num in active
+                  if current_degree < scenario_params[num]['max_degree'] and len(frontiers[num])]
+        if not active:
+            break
+
+        with metrics.stage(f'degree_{current_degree + 1}'):
+            union = unique_signatures(RideTable.concat([frontiers[num] for num in active]))
+            origins, destinations = candidate_extensions(union)
+            geometry = ride_geometry(origins, destinations, loose, skim_matrix,
+                                     backend=parameters.get('kernel_backend', 'auto'))
+            union_signatures = ride_signatures(union)
+            sub_rides = sub_ride_positions(union_signatures, origins, destinations)
+            for num in active:
+                # Candidates of a scenario have all sub-rides in its frontier
+                in_frontier = np.zeros(len(union_signatures) + 1, dtype=bool)
+                in_frontier[np.searchsorted(union_signatures, ride_signatures(frontiers[num]))] = True
+                candidates = in_frontier[sub_rides].all(axis=1)
+                metrics.count(f'degree_{current_degree + 1}', 'candidates', candidates.sum())
+                extended_rides = select_attractive(
+                    origin_order=origins[candidates],
+                    destination_order=destinations[candidates],
+                    geometry={name: values[candidates] for name, values in geometry.items()},
+                    requests=tables[num],
+                    params=scenario_params[num],
+                    metrics=metrics
+                )
+                if len(extended_rides):
+                    rides[num][current_degree + 1] = extended_rides
+        current_degree += 1
+        active = [num for num in active if current_degree in rides[num]]
+        optional_log(20, f"Rides of degree {current_degree} computed for "
+                         f"{len(active)} scenarios", logger)
+
+    return rides
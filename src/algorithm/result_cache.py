@@ -0,0 +1,232 @@
+""" Content-addressed on-disk cache of attractive rides """
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from logging import Logger
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from algorithm.feasibility_utils.ride_table import RideTable
+from utilities.general_utils import optional_log
+from utilities.skim import Skim
+
+# Columns of requests and parameters which determine the rides (max_degree is handled separately)
+REQUEST_COLUMNS = ['origin', 'destination', 'request_time', 'traveller_id', 'ASC_pool']
+RESULT_PARAMETERS = ['speed', 'price', 'share_discount', 'horizon', 'VoT', 'WtS',
+                     'delay_value', 'frontier_pruning', 'dist_threshold']
+FORMAT_VERSION = 1
+
+
+def skim_identity(
+        skim_matrix: Skim
+) -> str:
+    """ Identity of the skim: of its file if known, otherwise hash of its content """
+    if skim_matrix.identity is not None:
+        return skim_matrix.identity
+    digest = hashlib.sha256(skim_matrix.nodes.tobytes())
+    if hasattr(skim_matrix, 'adjacency'):
+        # Lazily computed skim, distances are determined by the graph
+        for values in [skim_matrix.adjacency.data, skim_matrix.adjacency.indices,
+                       skim_matrix.adjacency.indptr]:
+            digest.update(np.ascontiguousarray(values).tobytes())
+    else:
+        digest.update(np.ascontiguousarray(skim_matrix.matrix).tobytes())
+    return digest.hexdigest()
+
+
+def result_key(
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        travellers_characteristics: pd.DataFrame | None = None
+) -> str:
+    """
+    Hash of everything the attractive rides depend on, apart from max_degree
+    :param requests: requests, see attractive_rides
+    :param skim_matrix: skim with distances between nodes
+    :param parameters: parameters, only RESULT_PARAMETERS are used
+    :param travellers_characteristics: see attractive_rides
+    :return: hexadecimal key
+    """
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode())
+    columns = [col for col in REQUEST_COLUMNS if col in requests.columns]
+    digest.update(json.dumps(columns).encode())
+    digest.update(pd.util.hash_pandas_object(requests[columns], index=False).to_numpy().tobytes())
+    if travellers_characteristics is not None:
+        digest.update(pd.util.hash_pandas_object(travellers_characteristics, index=False)
+                      .to_numpy().tobytes())
+    digest.update(skim_identity(skim_matrix).encode())
+    digest.update(json.dumps({name: parameters.get(name) for name in RESULT_PARAMETERS},
+                             sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Rides of each degree stored as separate Parquet files in
+    a folder per result_key, with a manifest of computed degrees.
+    The least recently used results are evicted above max_bytes.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int | None = None,
+            logger: Logger | None = None
+    ):
+        """
+        :param path: folder of the cache
+        :param max_bytes: maximal size of the cache, None for unbounded
+        :param logger: for logging purposes
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.logger = logger
+        os.makedirs(path, exist_ok=True)
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.path, key, 'manifest.json')
+
+    def _degree_path(self, key: str, degree: int) -> str:
+        return os.path.join(self.path, key, f'degree_{degree}.parquet')
+
+    def load(
+            self,
+            key: str,
+            max_degree: int,
+            resume: bool = True
+    ) -> (dict, bool):
+        """
+        Cached rides for the key
+        :param key: see result_key
+        :param max_degree: maximal degree requested
+        :param resume: whether lower degrees are of use when higher are
+        missing (extension can be continued from the highest degree)
+        :return: rides by degree (up to max_degree) and whether they are complete
+        """
+        try:
+            with open(self._manifest_path(key), encoding='utf-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {}, False
+
+        complete = manifest['exhausted'] or max_degree <= manifest['max_degree']
+        if not complete and not resume:
+            return {}, False
+        rides = {degree: RideTable.from_arrow(pq.read_table(self._degree_path(key, degree)))
+                 for degree in manifest['degrees'] if degree <= max_degree}
+        manifest['accessed'] = time.time()
+        self._write_manifest(key, manifest)
+        optional_log(20, f"Rides of degrees {sorted(rides)} read from cache "
+                         f"({'complete' if complete else 'to be extended'})", self.logger)
+        return rides, complete
+
+    def store(
+            self,
+            key: str,
+            rides_by_degree: dict,
+            max_degree: int
+    ) -> None:
+        """
+        Store rides computed up to max_degree
+        :param key: see result_key
+        :param rides_by_degree: degree -> RideTable
+        :param max_degree: maximal degree requested, if rides of a lower degree are
+        the highest, no attractive extensions exist (the result is exhausted)
+        """
+        for degree, rides in rides_by_degree.items():
+            self.store_degree(key, degree, rides)
+        self.complete(key, sorted(rides_by_degree), max_degree)
+
+    def store_degree(
+            self,
+            key: str,
+            degree: int,
+            rides: RideTable
+    ) -> None:
+        """
+        Store rides of a single degree, valid once the result is completed.
+        The file is written under a temporary name and moved into place,
+        an existing file is kept only if it is readable and holds all rides.
+        """
+        folder = os.path.join(self.path, key)
+        os.makedirs(folder, exist_ok=True)
+        path = self._degree_path(key, degree)
+        if self._stored_rows(path) == len(rides):
+            return
+        descriptor, temporary = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        os.close(descriptor)
+        try:
+            pq.write_table(rides.to_arrow(), temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    @staticmethod
+    def _stored_rows(
+            path: str
+    ) -> int | None:
+        """ Number of rides in a stored file, None if it is missing or unreadable """
+        try:
+            return pq.read_metadata(path).num_rows
+        except (OSError, pa.ArrowException):
+            return None
+
+    def complete(
+            self,
+            key: str,
+            degrees: list,
+            max_degree: int
+    ) -> None:
+        """ Register stored degrees (see store) """
+        self._write_manifest(key, {
+            'degrees': sorted(degrees),
+            'max_degree': max_degree,
+            'exhausted': max(degrees) < max_degree,
+            'accessed': time.time()
+        })
+        self.evict()
+
+    def _write_manifest(
+            self,
+            key: str,
+            manifest: dict
+    ) -> None:
+        temporary = self._manifest_path(key) + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+        os.replace(temporary, self._manifest_path(key))
+
+    def entries(self) -> list:
+        """ (key, size in bytes, last access) of cached results """
+        entries = []
+        for key in os.listdir(self.path):
+            folder = os.path.join(self.path, key)
+            try:
+                with open(self._manifest_path(key), encoding='utf-8') as file:
+                    accessed = json.load(file)['accessed']
+            except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+                continue
+            size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+            entries.append((key, size, accessed))
+        return entries
+
+    def evict(self) -> None:
+        """ Remove least recently used results until the cache fits in max_bytes """
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+            total -= size
+            optional_log(20, f"Evicted cached result {key}", self.logger)
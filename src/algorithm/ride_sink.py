@@ -0,0 +1,206 @@
+""" Streaming storage of attractive rides, degree by degree (Parquet or Arrow IPC) """
+import json
+import os
+from logging import Logger
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from algorithm.attractive_rides import ride_degrees, shareability_output
+from algorithm.feasibility_utils.ride_table import RideTable
+from algorithm.result_cache import ResultCache
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
+
+IPC_EXTENSIONS = ['.arrow', '.ipc', '.feather']
+# Maximal number of rides in a row group (Parquet) or record batch (Arrow IPC)
+BATCH_ROWS = 1 << 20
+_MATRIX_COLUMNS = ['ids', 'origin_order', 'destination_order', 'delays', 'u_traveller_individual']
+
+
+def _schema() -> pa.Schema:
+    """ Schema common to all degrees, matrices of rides are list columns """
+    ride_table = RideTable.empty(1)
+    fields = [pa.field('degree', pa.int16())]
+    for name in RideTable.__dataclass_fields__:
+        values = getattr(ride_table, name)
+        value_type = pa.from_numpy_dtype(values.dtype)
+        fields.append(pa.field(name, pa.list_(value_type) if name in _MATRIX_COLUMNS else value_type))
+    return pa.schema(fields)
+
+
+def _to_batch(
+        rides: RideTable
+) -> pa.RecordBatch:
+    """ Rides of a single degree in the sink schema """
+    offsets = pa.array(np.arange(len(rides) + 1, dtype=np.int32) * rides.degree)
+    columns = [pa.array(np.full(len(rides), rides.degree, dtype=np.int16))]
+    for name in RideTable.__dataclass_fields__:
+        values = getattr(rides, name)
+        columns.append(pa.ListArray.from_arrays(offsets, pa.array(values.ravel()))
+                       if name in _MATRIX_COLUMNS else pa.array(values))
+    return pa.RecordBatch.from_arrays(columns, schema=_schema())
+
+
+def _from_table(
+        table: pa.Table,
+        degree: int
+) -> RideTable:
+    """ Inverse of _to_batch """
+    columns = {}
+    for name in RideTable.__dataclass_fields__:
+        column = table.column(name).combine_chunks()
+        if name in _MATRIX_COLUMNS:
+            columns[name] = column.flatten().to_numpy().reshape(-1, degree)
+        else:
+            columns[name] = column.to_numpy()
+    return RideTable(**columns)
+
+
+class RideSink:
+    """
+    Writes rides of consecutive degrees to a single file as soon as
+    they are computed: Parquet row groups or Arrow IPC record batches
+    (by extension, see IPC_EXTENSIONS), each holding rides of one degree.
+    Use as a context manager, read back with RideReader.
+    """
+
+    def __init__(
+            self,
+            path: str
+    ):
+        """ :param path: output file, .parquet or an Arrow IPC extension """
+        self.path = path
+        self.ipc = os.path.splitext(path)[1] in IPC_EXTENSIONS
+        self.degrees = []
+        self._batch_degrees = []
+        self._number_of_rides = 0
+        self._writer = ipc.new_file(path, _schema()) if self.ipc else pq.ParquetWriter(path, _schema())
+
+    def write(
+            self,
+            degree: int,
+            rides: RideTable
+    ) -> None:
+        """ Append rides of a degree (each degree is written once) """
+        assert degree not in self.degrees, f"Rides of degree {degree} are already written"
+        assert rides.degree == degree, "Rides of a different degree"
+        self.degrees.append(degree)
+        # Empty degrees are written too, so that they are known to the reader
+        for start in range(0, max(len(rides), 1), BATCH_ROWS):
+            batch = _to_batch(rides.take(slice(start, start + BATCH_ROWS)))
+            if self.ipc:
+                self._writer.write_batch(batch, custom_metadata={'degree': str(degree)})
+            else:
+                self._writer.write_table(pa.Table.from_batches([batch]), row_group_size=BATCH_ROWS)
+            self._batch_degrees.append(degree)
+        self._number_of_rides += len(rides)
+
+    def __len__(self) -> int:
+        """ Number of rides written """
+        return self._number_of_rides
+
+    def close(self) -> None:
+        if not self.ipc:
+            self._writer.add_key_value_metadata({'row_group_degrees': json.dumps(self._batch_degrees)})
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RideReader:
+    """ Lazy reader of a RideSink file, rides are read by degree on demand """
+
+    def __init__(
+            self,
+            path: str
+    ):
+        """ :param path: file written by RideSink """
+        self.path = path
+        self.ipc = os.path.splitext(path)[1] in IPC_EXTENSIONS
+        if self.ipc:
+            self._file = ipc.open_file(pa.memory_map(path))
+            batch_degrees = [int(self._file.get_batch_with_custom_metadata(num).custom_metadata[b'degree'])
+                             for num in range(self._file.num_record_batches)]
+        else:
+            self._file = pq.ParquetFile(path)
+            batch_degrees = json.loads(self._file.metadata.metadata[b'row_group_degrees'])
+        self._batches = {}
+        for num, degree in enumerate(batch_degrees):
+            self._batches.setdefault(degree, []).append(num)
+
+    @property
+    def degrees(self) -> list:
+        """ Degrees of rides in the file """
+        return sorted(self._batches)
+
+    def read(
+            self,
+            degree: int
+    ) -> RideTable:
+        """ Rides of the degree (empty if absent) """
+        if degree not in self._batches:
+            return RideTable.empty(degree)
+        if self.ipc:
+            table = pa.Table.from_batches([self._file.get_batch(num) for num in self._batches[degree]])
+        else:
+            table = self._file.read_row_groups(self._batches[degree])
+        return _from_table(table, degree)
+
+    def __iter__(self):
+        """ Iterate over (degree, RideTable), one degree in memory at a time """
+        for degree in self.degrees:
+            yield degree, self.read(degree)
+
+    def __len__(self) -> int:
+        """ Number of rides in the file """
+        if self.ipc:
+            return sum(self._file.get_batch(num).num_rows for num in range(self._file.num_record_batches))
+        return self._file.metadata.num_rows
+
+    def rides_by_degree(self) -> dict:
+        """ All rides, dictionary degree -> RideTable """
+        return dict(iter(self))
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ All rides in the attractive_rides output format """
+        return shareability_output(self.rides_by_degree())
+
+
+def stream_attractive_rides(
+        path: str,
+        requests: pd.DataFrame,
+        skim_matrix: Skim,
+        parameters: dict,
+        travellers_characteristics: dict | None = None,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None,
+        cache: ResultCache | None = None
+) -> RideReader:
+    """
+    Attractive rides (see attractive_rides) written to a file degree
+    by degree as they are computed, instead of being kept in memory
+    :param path: output file, .parquet or an Arrow IPC extension (see RideSink)
+    :return: lazy reader of the rides
+    """
+    with RideSink(path) as sink:
+        for degree, rides in ride_degrees(
+                requests=requests,
+                skim_matrix=skim_matrix,
+                parameters=parameters,
+                travellers_characteristics=travellers_characteristics,
+                logger=logger,
+                metrics=metrics,
+                cache=cache
+        ):
+            sink.write(degree, rides)
+            optional_log(10, f"{len(rides)} rides of degree {degree} written to {path}", logger)
+    return RideReader(path)
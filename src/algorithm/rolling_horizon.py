@@ -0,0 +1,107 @@
+""" Rolling-horizon (streaming) computation of attractive rides """
+from logging import Logger
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import shareability_rides, shareability_output
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
+
+
+def read_demand_chunks(
+        path: str,
+        chunksize: int = 10000
+) -> Iterator[pd.DataFrame]:
+    """ Read a .csv demand file (sorted by request_time) in chunks """
+    yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def rolling_attractive_rides(
+        demand: pd.DataFrame or Iterable[pd.DataFrame],
+        skim_matrix: Skim,
+        parameters: dict,
+        window: int,
+        logger: Logger | None = None,
+        metrics: Metrics | None = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Attractive rides computed in consecutive time windows. Travellers
+    further apart in time than the horizon never share (pair filter),
+    hence for each window only requests within the horizon before its
+    start are kept, and a ride is emitted only in the window in which
+    its latest traveller requests. Each ride is emitted exactly once
+    and memory is bounded by the number of requests per horizon + window.
+    :param demand: requests (see attractive_rides) as a dataframe or
+    chunks of it, ordered by request_time
+    :param skim_matrix: skim with distances between nodes
+    :param parameters: params of attractive_rides, horizon is required
+    :param window: length of a window in seconds
+    :param logger: for logging purposes
+    :param metrics: collects statistics of stages summed over the windows
+    :return: generator of rides (ride_output_columns) for consecutive windows
+    """
+    assert parameters.get('horizon', 0) > 0, "Rolling horizon requires a positive 'horizon'"
+    lookback = pd.Timedelta(seconds=parameters['horizon'])
+    window = pd.Timedelta(seconds=window)
+
+    if isinstance(demand, pd.DataFrame):
+        demand = [demand]
+
+    buffer = pd.DataFrame()
+    next_id = 1
+    window_start = None
+
+    for chunk in demand:
+        chunk = chunk.copy()
+        chunk['request_time'] = pd.to_datetime(chunk['request_time'], format='%Y-%m-%d %H:%M:%S')
+        if 'traveller_id' not in chunk.columns:
+            chunk['traveller_id'] = np.arange(next_id, next_id + len(chunk))
+        next_id += len(chunk)
+        buffer = pd.concat([buffer, chunk], ignore_index=True)
+        if window_start is None:
+            window_start = buffer['request_time'].min()
+
+        # Process windows which cannot receive any more requests
+        while len(buffer) and buffer['request_time'].max() >= window_start + window:
+            yield _window_rides(buffer, window_start, window, skim_matrix, parameters,
+                                logger, metrics)
+            window_start += window
+            buffer = buffer.loc[buffer['request_time'] >= window_start - lookback]
+
+    while len(buffer) and buffer['request_time'].max() >= window_start:
+        yield _window_rides(buffer, window_start, window, skim_matrix, parameters,
+                            logger, metrics)
+        window_start += window
+
+
+def _window_rides(
+        buffer: pd.DataFrame,
+        window_start: pd.Timestamp,
+        window: pd.Timedelta,
+        skim_matrix: Skim,
+        parameters: dict,
+        logger: Logger | None,
+        metrics: Metrics | None
+) -> pd.DataFrame:
+    """ Rides with at least one (hence the latest) traveller in the window """
+    active = buffer.loc[buffer['request_time'] < window_start + window].copy()
+    new_travellers = active.loc[active['request_time'] >= window_start, 'traveller_id'].to_numpy()
+    active['request_time'] = active['request_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    rides_by_degree = shareability_rides(
+        requests=active.reset_index(drop=True),
+        skim_matrix=skim_matrix,
+        parameters=parameters,
+        metrics=metrics
+    )
+    rides_by_degree = {
+        degree: rides.take(np.isin(rides.ids, new_travellers).any(axis=1))
+        for degree, rides in rides_by_degree.items()
+    }
+
+    optional_log(20, f"Window starting {window_start}: {len(new_travellers)} requests, "
+                     f"{sum(len(t) for t in rides_by_degree.values())} rides", logger)
+    return shareability_output(rides_by_degree)
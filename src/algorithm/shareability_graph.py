@@ -0,0 +1,238 @@
+""" Shareability graph updated online, request by request """
+from logging import Logger
+
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import prepare_requests, shareability_output
+from algorithm.feasibility_utils.singles import single_rides
+from algorithm.feasibility_utils.pairs import pair_pool
+from algorithm.feasibility_utils.high_order_rides_v02 import candidate_extensions, evaluate_rides
+from algorithm.feasibility_utils.pruning import unique_signatures
+from algorithm.feasibility_utils.request_table import RequestTable
+from algorithm.feasibility_utils.ride_table import RideTable
+from utilities.general_utils import optional_log
+from utilities.metrics import Metrics
+from utilities.skim import Skim
+
+
+class ShareabilityGraph:
+    """
+    Attractive rides (as attractive_rides) of the active requests, updated
+    as requests arrive (add_request) and leave (expire_before).
+    Rides are stored in chunks by the traveller whose arrival created them
+    (the latest added member). A new traveller can only share rides with
+    travellers it forms attractive pairs with (its neighbours), hence
+    an arrival evaluates only its pairs and extensions of rides of its
+    neighbours, independently of the total number of rides in the graph.
+    Rides are not pruned (frontier_pruning 'strict').
+    """
+
+    def __init__(
+            self,
+            skim_matrix: Skim,
+            parameters: dict,
+            travellers_characteristics: pd.DataFrame | None = None,
+            reference_time: str | pd.Timestamp | None = None,
+            logger: Logger | None = None,
+            metrics: Metrics | None = None
+    ):
+        """
+        :param skim_matrix: skim with distances between nodes
+        :param parameters: params of attractive_rides
+        :param travellers_characteristics: see attractive_rides
+        :param reference_time: request times are measured from it,
+        by default from the first request
+        :param logger: for logging purposes
+        :param metrics: collects statistics of stages summed over arrivals
+        """
+        assert parameters.get('frontier_pruning', 'strict') == 'strict', \
+            "Online updates support only 'strict' frontier pruning"
+        self.skim_matrix = skim_matrix
+        self.parameters = parameters
+        self.travellers_characteristics = travellers_characteristics
+        self.reference_time = None if reference_time is None else pd.Timestamp(reference_time)
+        self.logger = logger
+        self.metrics = Metrics() if metrics is None else metrics
+
+        self.requests = None
+        self._next_id = 1
+        # traveller -> degree -> rides created at its arrival
+        self._chunks = {}
+        # traveller -> travellers whose chunks include it
+        self._in_chunks = {}
+        # traveller -> travellers with an attractive pair
+        self._neighbours = {}
+
+    def __len__(self) -> int:
+        """ Number of active requests """
+        return 0 if self.requests is None else len(self.requests)
+
+    def add_request(
+            self,
+            request: dict | pd.Series
+    ) -> dict:
+        """
+        Add a request and compute rides including it
+        :param request: origin, destination, request_time
+        and optionally traveller_id (see attractive_rides)
+        :return: new rides, dictionary degree -> RideTable
+        """
+        metrics = self.metrics
+        with metrics.stage('preprocessing'):
+            prepared = self._prepare(request)
+            traveller = int(prepared['traveller_id'].iloc[0])
+            assert traveller not in self._chunks, f"Traveller {traveller} is already active"
+            new_request = RequestTable.from_requests(prepared)
+            if self.requests is None:
+                self.requests = new_request
+            else:
+                self.requests = RequestTable(**{
+                    column: np.concatenate([values, getattr(new_request, column)])
+                    for column, values in self.requests.to_dict().items()})
+
+        with metrics.stage('single_rides'):
+            new_rides = {1: single_rides(prepared)}
+
+        if self.parameters['max_degree'] > 1:
+            new_rides[2] = pair_pool(
+                requests=self.requests,
+                params=self.parameters,
+                skim_matrix=self.skim_matrix,
+                logger=None,
+                metrics=metrics,
+                among=np.array([len(self.requests) - 1])
+            )
+        neighbours = set(new_rides.get(2, RideTable.empty(2)).ids.ravel().tolist()) - {traveller}
+        self._neighbours[traveller] = neighbours
+        for other in neighbours:
+            self._neighbours[other].add(traveller)
+
+        degree = 2
+        while degree < self.parameters['max_degree'] and len(new_rides[degree]):
+            with metrics.stage(f'degree_{degree + 1}'):
+                extended = self._extend(traveller, neighbours, new_rides[degree])
+            if not len(extended):
+                break
+            degree += 1
+            new_rides[degree] = extended
+
+        self._chunks[traveller] = new_rides
+        self._in_chunks[traveller] = set()
+        for rides in new_rides.values():
+            for member in np.unique(rides.ids).tolist():
+                self._in_chunks[member].add(traveller)
+
+        optional_log(10, f"Traveller {traveller} added with "
+                         f"{sum(len(rides) for rides in new_rides.values())} rides", self.logger)
+        return new_rides
+
+    def _prepare(
+            self,
+            request: dict | pd.Series
+    ) -> pd.DataFrame:
+        """ Prepared request (see prepare_requests) with time measured from reference_time """
+        request = pd.DataFrame([dict(request)])
+        request_time = pd.to_datetime(request['request_time'].iloc[0], format='%Y-%m-%d %H:%M:%S')
+        if 'traveller_id' not in request.columns:
+            request['traveller_id'] = self._next_id
+        self._next_id = max(self._next_id, int(request['traveller_id'].iloc[0])) + 1
+        if self.reference_time is None:
+            self.reference_time = request_time
+
+        prepared = prepare_requests(
+            requests=request,
+            skim_matrix=self.skim_matrix,
+            parameters=self.parameters,
+            travellers_characteristics=self.travellers_characteristics,
+            logger=None
+        )
+        prepared['t_req_int'] = int((request_time - self.reference_time).total_seconds())
+        return prepared
+
+    def _extend(
+            self,
+            traveller: int,
+            neighbours: set,
+            new_rides: RideTable
+    ) -> RideTable:
+        """
+        Attractive rides of degree k+1 including the traveller. All their
+        sub-rides of degree k are attractive: new_rides (with the traveller)
+        and rides of neighbours only (without, created by one of them),
+        which are the frontier.
+        """
+        degree = new_rides.degree
+        local = [new_rides]
+        for other in neighbours:
+            rides = self._chunks[other].get(degree)
+            if rides is not None and len(rides):
+                local.append(rides.take(np.isin(rides.ids, list(neighbours)).all(axis=1)))
+
+        origins, destinations = candidate_extensions(RideTable.concat(local))
+        with_traveller = (origins == traveller).any(axis=1)
+        extended = evaluate_rides(
+            origin_order=origins[with_traveller],
+            destination_order=destinations[with_traveller],
+            requests=self.requests,
+            params=self.parameters,
+            skim_matrix=self.skim_matrix,
+            metrics=self.metrics
+        )
+        return unique_signatures(extended)
+
+    def _created_by(
+            self,
+            travellers: set
+    ) -> set:
+        """ Travellers whose chunks include rides with any of the travellers """
+        return set().union(*(self._in_chunks[t] for t in travellers)) if travellers else set()
+
+    def expire_before(
+            self,
+            time: str | pd.Timestamp
+    ) -> np.ndarray:
+        """
+        Remove requests made before the time and the rides including them
+        :param time: timestamp, requests with earlier request_time are removed
+        :return: ids of removed travellers
+        """
+        if not len(self):
+            return np.array([], dtype=np.int64)
+        limit = (pd.Timestamp(time) - self.reference_time).total_seconds()
+        expired = self.requests.t_req_int < limit
+        expired_ids = self.requests.traveller_id[expired]
+        if not len(expired_ids):
+            return expired_ids
+
+        removed = set(expired_ids.tolist())
+        for other in self._created_by(removed) - removed:
+            self._chunks[other] = {
+                degree: rides.take(~np.isin(rides.ids, expired_ids).any(axis=1))
+                for degree, rides in self._chunks[other].items()
+            }
+        for traveller in removed:
+            del self._chunks[traveller]
+            del self._in_chunks[traveller]
+            for other in self._neighbours.pop(traveller) - removed:
+                self._neighbours[other].discard(traveller)
+        for traveller in self._in_chunks:
+            self._in_chunks[traveller] -= removed
+        self.requests = self.requests.take(~expired)
+
+        optional_log(10, f"{len(removed)} requests expired", self.logger)
+        return expired_ids
+
+    def rides(self) -> dict:
+        """ Rides of active requests, dictionary degree -> RideTable """
+        rides_by_degree = {}
+        for chunk in self._chunks.values():
+            for degree, rides in chunk.items():
+                rides_by_degree.setdefault(degree, []).append(rides)
+        return {degree: RideTable.concat(tables)
+                for degree, tables in sorted(rides_by_degree.items())}
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ Rides of active requests as the attractive_rides output """
+        rides_by_degree = self.rides()
+        return shareability_output(rides_by_degree if rides_by_degree else {1: RideTable.empty(1)})
@@ -0,0 +1 @@
+""" Offline benchmarks on synthetic cities and demand """
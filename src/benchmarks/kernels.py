@@ -0,0 +1,97 @@
+""" Equivalence of kernel backends (see algorithm.feasibility_utils.kernels) on synthetic data
+
+Usage (from src):
+    python -m benchmarks.kernels --requests 300 --max-degree 4
+    python -m benchmarks.kernels --backends numpy numba --requests 2000
+Without Numba the loop kernels are checked uncompiled ('python' backend).
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import DEFAULT_PARAMETERS, grid_city, city_skim, synthetic_demand
+from algorithm.attractive_rides import shareability_rides
+from algorithm.feasibility_utils.kernels import numba, select_kernels
+
+
+def kernel_differences(
+        reference: str,
+        backend: str,
+        size: int = 10000,
+        seed: int = 0
+) -> list:
+    """
+    Compare kernels of two backends on random inputs, including ties,
+    zero and negative delays and repeated travellers across rides
+    :return: names of kernels with different results
+    """
+    rng = np.random.default_rng(seed)
+    times = [rng.integers(0, 1000, size) for _ in range(5)]
+    delay = rng.integers(-300, 300, size)
+    max_delays = [rng.choice([0., 30.5, 150., 1e9], size) for _ in range(2)]
+    degree = 4
+    origin_order = np.array([rng.permutation(degree) + 10 * num for num in range(size)])
+    destination_order = np.array([rng.permutation(row) for row in origin_order])
+    cumulative = np.cumsum(rng.uniform(0, 500, (size, 2 * degree)), axis=1)
+
+    differences = []
+    for name, arguments in [('pair_travel_times', times),
+                            ('split_delay', [delay, *max_delays]),
+                            ('traveller_distances', [cumulative, origin_order, destination_order])]:
+        expected = getattr(select_kernels(reference), name)(*arguments)
+        result = getattr(select_kernels(backend), name)(*arguments)
+        if expected.dtype != result.dtype or not np.array_equal(expected, result):
+            differences.append(name)
+    return differences
+
+
+def ride_differences(
+        reference: dict,
+        rides: dict
+) -> list:
+    """ Degrees and columns in which rides (degree -> RideTable) differ """
+    if sorted(reference) != sorted(rides):
+        return [f"degrees {sorted(reference)} vs {sorted(rides)}"]
+    return [f"degree {degree}: {name}" for degree, table in reference.items()
+            for name in table.__dataclass_fields__
+            if not np.array_equal(getattr(table, name), getattr(rides[degree], name))]
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+',
+                        default=['numpy', 'numba' if numba is not None else 'python'])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--max-degree', type=int, default=4)
+    parser.add_argument('--city-size', type=int, default=20)
+    parser.add_argument('--duration', type=int, default=1800)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    skim = city_skim(grid_city(args.city_size))
+    demand = synthetic_demand(skim, args.requests, duration=args.duration, seed=args.seed)
+    reference_backend, reference = args.backends[0], None
+    issues = []
+    for backend in args.backends:
+        params = {**DEFAULT_PARAMETERS, 'max_degree': args.max_degree, 'kernel_backend': backend}
+        start = time.perf_counter()
+        rides = shareability_rides(demand.copy(), skim, params)
+        print(f"{backend}: {time.perf_counter() - start:.3f}s, "
+              f"rides {({degree: len(table) for degree, table in rides.items()})}")
+        if reference is None:
+            reference = rides
+            continue
+        issues += [f"{backend} kernel {name}" for name in kernel_differences(reference_backend, backend)]
+        issues += [f"{backend} rides {issue}" for issue in ride_differences(reference, rides)]
+
+    for issue in issues:
+        print(f"DIFFERENT {issue}")
+    if not issues:
+        print(f"Backends {args.backends} produce identical rides")
+    return 1 if issues else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
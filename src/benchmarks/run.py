@@ -0,0 +1,165 @@
+""" Stage-by-stage benchmark of attractive_rides on synthetic data
+
+Usage (from src):
+    python -m benchmarks.run --sizes 150 1000 5000 --max-degree 4 --output results.json
+    python -m benchmarks.run --sizes 150 1000 --baseline results.json --tolerance 0.2
+"""
+import argparse
+import json
+import platform
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import DEFAULT_PARAMETERS, grid_city, random_geometric_city, \
+    city_skim, synthetic_demand
+from algorithm.attractive_rides import shareability_rides
+from utilities.metrics import Metrics
+
+# Differences in wall time below this many seconds are considered noise
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def benchmark(
+        requests: int,
+        city: str = 'grid',
+        city_size: int = 30,
+        max_degree: int = 3,
+        duration: int = 3600,
+        seed: int = 0,
+        parameters: dict | None = None
+) -> dict:
+    """
+    Run the stages of attractive_rides on a synthetic instance
+    :param requests: number of requests
+    :param city: 'grid' (city_size x city_size) or 'geometric' (city_size ** 2 nodes)
+    :param city_size: size of the city, see above
+    :param max_degree: maximal degree of rides
+    :param duration: requests are spread over this many seconds
+    :param seed: random seed of the city and demand
+    :param parameters: overrides of DEFAULT_PARAMETERS
+    :return: timings and peak memory by stage, candidate counts, rides by degree
+    """
+    if city == 'grid':
+        city_graph = grid_city(city_size)
+    else:
+        city_graph = random_geometric_city(city_size ** 2, seed=seed)
+    skim = city_skim(city_graph)
+    demand = synthetic_demand(skim, requests, duration=duration, seed=seed)
+    params = {**DEFAULT_PARAMETERS, **(parameters or {}), 'max_degree': max_degree}
+
+    metrics = Metrics()
+    rides = shareability_rides(demand, skim, params, metrics=metrics)
+
+    return {
+        'requests': requests,
+        'city': city,
+        'city_size': city_size,
+        'max_degree': max_degree,
+        'duration': duration,
+        'seed': seed,
+        'stages': metrics.stages,
+        'counts': metrics.counts,
+        'total_wall': sum(stage['wall'] for stage in metrics.stages.values()),
+        'rides': {str(degree): len(table) for degree, table in rides.items()}
+    }
+
+
+def run_suite(
+        sizes: list,
+        isolate: bool = True,
+        **kwargs
+) -> dict:
+    """
+    Benchmark every size, by default each in a fresh process
+    so that the peak memory is measured per size
+    """
+    results = []
+    for requests in sizes:
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(benchmark, requests, **kwargs).result())
+        else:
+            results.append(benchmark(requests, **kwargs))
+    return {
+        'environment': {'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'machine': platform.machine()},
+        'results': results
+    }
+
+
+def compare(
+        results: dict,
+        baseline: dict,
+        tolerance: float = 0.2
+) -> list:
+    """
+    Compare results with a baseline run
+    :param results: output of run_suite
+    :param baseline: output of run_suite on the reference version
+    :param tolerance: relative slowdown of a stage flagged as a regression
+    :return: descriptions of regressions and changed outputs
+    """
+    reference = {(r['requests'], r['city'], r['max_degree']): r for r in baseline['results']}
+    issues = []
+    for result in results['results']:
+        base = reference.get((result['requests'], result['city'], result['max_degree']))
+        if base is None:
+            continue
+        label = f"{result['requests']} requests ({result['city']})"
+        if result['rides'] != base['rides']:
+            issues.append(f"{label}: rides changed from {base['rides']} to {result['rides']}")
+        for name, stage in result['stages'].items():
+            if name not in base['stages']:
+                continue
+            before, after = base['stages'][name]['wall'], stage['wall']
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_SECONDS:
+                issues.append(f"{label}: {name} slower {before:.3f}s -> {after:.3f}s")
+    return issues
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[150, 1000, 5000])
+    parser.add_argument('--max-degree', type=int, default=3)
+    parser.add_argument('--city', choices=['grid', 'geometric'], default='grid')
+    parser.add_argument('--city-size', type=int, default=30)
+    parser.add_argument('--duration', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this .json file')
+    parser.add_argument('--baseline', help='compare with results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--no-isolate', action='store_true', help='run all sizes in this process')
+    args = parser.parse_args(argv)
+
+    results = run_suite(
+        sizes=args.sizes,
+        isolate=not args.no_isolate,
+        city=args.city,
+        city_size=args.city_size,
+        max_degree=args.max_degree,
+        duration=args.duration,
+        seed=args.seed
+    )
+
+    for result in results['results']:
+        stages = ', '.join(f"{name} {stage['wall']:.3f}s" for name, stage in result['stages'].items())
+        print(f"{result['requests']} requests: {stages}; rides {result['rides']}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            issues = compare(results, json.load(file), args.tolerance)
+        for issue in issues:
+            print(f"REGRESSION {issue}")
+        return 1 if issues else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
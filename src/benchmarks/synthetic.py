@@ -0,0 +1,105 @@
+""" Synthetic cities and demand, no network access required """
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from utilities.skim import Skim
+from utilities.skim_builder import graph_to_csr
+
+# Behavioural parameters as in configs/behaviour, price per km as in the original ExMAS
+DEFAULT_PARAMETERS = {
+    'VoT': 0.0046,
+    'WtS': 1.14756,
+    'delay_value': 1,
+    'speed': 6,
+    'share_discount': 0.3,
+    'price': 1.5,
+    'horizon': 1200,
+    'max_degree': 3
+}
+
+
+def grid_city(
+        side: int,
+        spacing: float = 200
+) -> nx.DiGraph:
+    """ Manhattan-like grid with two-way streets """
+    city_graph = nx.DiGraph()
+    for x in range(side):
+        for y in range(side):
+            city_graph.add_node(x * side + y, x=x * spacing, y=y * spacing)
+    for x in range(side):
+        for y in range(side):
+            for dx, dy in [(1, 0), (0, 1)]:
+                if x + dx < side and y + dy < side:
+                    u, v = x * side + y, (x + dx) * side + y + dy
+                    city_graph.add_edge(u, v, length=spacing)
+                    city_graph.add_edge(v, u, length=spacing)
+    return city_graph
+
+
+def random_geometric_city(
+        nodes: int,
+        size: float = 6000,
+        neighbours: int = 4,
+        seed: int = 0
+) -> nx.DiGraph:
+    """ Nodes spread uniformly over a square, linked to the nearest neighbours """
+    rng = np.random.default_rng(seed)
+    coordinates = rng.uniform(0, size, (nodes, 2))
+    distances, nearest = cKDTree(coordinates).query(coordinates, k=neighbours + 1)
+    city_graph = nx.DiGraph()
+    for num, (x, y) in enumerate(coordinates):
+        city_graph.add_node(num, x=x, y=y)
+    for u in range(nodes):
+        for length, v in zip(distances[u, 1:], nearest[u, 1:]):
+            city_graph.add_edge(u, int(v), length=float(length))
+            city_graph.add_edge(int(v), u, length=float(length))
+    # Keep the largest strongly connected part, so that all distances are finite
+    largest = max(nx.strongly_connected_components(city_graph), key=len)
+    return city_graph.subgraph(largest).copy()
+
+
+def city_skim(
+        city_graph: nx.DiGraph
+) -> Skim:
+    """ All-pairs skim of a (small) synthetic city computed in memory """
+    adjacency, nodes = graph_to_csr(city_graph)
+    return Skim(dijkstra(adjacency, directed=True), nodes)
+
+
+def synthetic_demand(
+        skim: Skim,
+        requests: int,
+        duration: int = 3600,
+        min_distance: float = 1000,
+        start: str = '2024-01-01 08:00:00',
+        seed: int = 0
+) -> pd.DataFrame:
+    """
+    Requests with uniform origins, destinations and request times
+    :param skim: skim of the city
+    :param requests: number of requests
+    :param duration: requests are spread over this many seconds (density)
+    :param min_distance: shorter trips are redrawn
+    :param start: time of the first request
+    :param seed: random seed
+    :return: demand in the format of attractive_rides
+    """
+    rng = np.random.default_rng(seed)
+    origins = rng.choice(skim.nodes, requests)
+    destinations = rng.choice(skim.nodes, requests)
+    too_short = skim[origins, destinations] < min_distance
+    while too_short.any():
+        destinations[too_short] = rng.choice(skim.nodes, too_short.sum())
+        too_short = skim[origins, destinations] < min_distance
+
+    request_times = pd.Timestamp(start) + pd.to_timedelta(
+        np.sort(rng.integers(0, duration, requests)), unit='s')
+    return pd.DataFrame({
+        'origin': origins,
+        'destination': destinations,
+        'request_time': request_times.strftime('%Y-%m-%d %H:%M:%S')
+    })
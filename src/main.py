@@ -1,7 +1,17 @@
 """ Main script for calling the ExMAS_Revised loop """
+import argparse
+import os
+
 import utilities.preprocessing
 from utilities.general_utils import initialise_logger
-from algorithm.attractive_rides import attractive_rides
+from utilities.metrics import Metrics
+from algorithm.attractive_rides import shareability_rides, shareability_output
+from algorithm.matching import match_rides
+from algorithm.result_cache import ResultCache
+from algorithm.ride_sink import RideReader, stream_attractive_rides
+from algorithm.rolling_horizon import rolling_attractive_rides, read_demand_chunks
+
+DEFAULT_CONFIGURATION = 'configs/runs/run_nyc.json'
 
 
 def exmas_revised(
@@ -9,21 +19,118 @@ def exmas_revised(
 ) -> dict:
     """ Main caller of the algorithm
     @param configuration_path: path to the .json configuration file
-    @return computed results
+    @return computed results: attractive rides ('rides', not kept
+    in the rolling horizon mode, with 'ride_sink' configured a lazy reader
+    of the file the rides are streamed to), if 'matching' is configured the selected
+    rides ('schedule') with the objective and solve time ('matching'),
+    and statistics of stages ('metrics')
     """
     configuration = utilities.preprocessing.load_configuration(path=configuration_path)
     main_logger = initialise_logger(logger_level=configuration.get('logger_level', 'INFO'))
-    skim_matrix = utilities.preprocessing.load_skim(
-        config=configuration, logger=main_logger)
-    demand = utilities.preprocessing.load_demand(
-        configuration['requests'], config=configuration, logger=main_logger)
-    shareability = attractive_rides(
-        requests=demand,
-        skim_matrix=skim_matrix,
-        parameters=configuration,
-        logger=main_logger
-    )
-
-    return {}
-
-exmas_revised('configs/runs/run_nyc.json')
\ No newline at end of file
+    metrics = Metrics(profile=configuration.get('profile', False))
+    results = {}
+    if configuration.get('rolling_window'):
+        # Stream the demand (sorted by time) in windows
+        skim_matrix = utilities.preprocessing.load_skim(
+            config=configuration, logger=main_logger)
+        number_of_rides = 0
+        for window_rides in rolling_attractive_rides(
+                demand=read_demand_chunks(configuration['requests']),
+                skim_matrix=skim_matrix,
+                parameters=configuration,
+                window=configuration['rolling_window'],
+                logger=main_logger,
+                metrics=metrics
+        ):
+            number_of_rides += len(window_rides)
+        main_logger.info(f"Rolling horizon computed {number_of_rides} rides")
+        results['number_of_rides'] = number_of_rides
+    else:
+        demand = utilities.preprocessing.load_demand(
+            configuration['requests'], config=configuration, logger=main_logger)
+        skim_matrix = utilities.preprocessing.load_skim(
+            config=configuration, logger=main_logger, demand=demand)
+        cache = None
+        if configuration.get('result_cache'):
+            cache = ResultCache(
+                path=configuration['result_cache'],
+                max_bytes=configuration.get('result_cache_bytes'),
+                logger=main_logger
+            )
+        if configuration.get('ride_sink'):
+            # Degrees are written as they are computed, not kept in memory
+            results['rides'] = stream_attractive_rides(
+                path=configuration['ride_sink'],
+                requests=demand,
+                skim_matrix=skim_matrix,
+                parameters=configuration,
+                logger=main_logger,
+                metrics=metrics,
+                cache=cache
+            )
+            main_logger.info(f"Rides saved to {configuration['ride_sink']}")
+        else:
+            rides_by_degree = shareability_rides(
+                requests=demand,
+                skim_matrix=skim_matrix,
+                parameters=configuration,
+                logger=main_logger,
+                metrics=metrics,
+                cache=cache
+            )
+            results['rides'] = shareability_output(rides_by_degree)
+        results['number_of_rides'] = len(results['rides'])
+        if configuration.get('matching'):
+            matching = match_rides(
+                rides_by_degree=rides_by_degree if not configuration.get('ride_sink')
+                else results['rides'].rides_by_degree(),
+                objective=configuration.get('matching_objective', 'veh_distance'),
+                method=configuration['matching'],
+                time_limit=configuration.get('matching_time_limit'),
+                local_search_passes=configuration.get('matching_local_search', 0),
+                logger=main_logger,
+                metrics=metrics
+            )
+            results['schedule'] = matching.pop('schedule')
+            results['matching'] = matching
+    if hasattr(skim_matrix, 'cache_info'):
+        main_logger.info(f"Skim cache statistics: {skim_matrix.cache_info()}")
+
+    results['metrics'] = metrics.to_dict()
+    if configuration.get('metrics_path'):
+        metrics.dump(configuration['metrics_path'])
+        main_logger.info(f"Metrics saved to {configuration['metrics_path']}")
+
+    return results
+
+
+def main(
+        argv: list | None = None
+) -> dict:
+    """
+    Command line entry point, e.g. python main.py configs/runs/run_nyc.json.
+    Artifacts (city graph, skim, snapped demand) are expected to be
+    prepared beforehand with prepare.py, otherwise they are computed here.
+    """
+    parser = argparse.ArgumentParser(description="Compute attractive shared rides (ExMAS)")
+    parser.add_argument('configuration', nargs='?', default=DEFAULT_CONFIGURATION,
+                        help="path to the .json configuration file")
+    parser.add_argument('--output', help="save the rides to a .parquet or .csv file")
+    parser.add_argument('--schedule', help="save the matched rides to a .parquet or .csv file")
+    args = parser.parse_args(argv)
+
+    results = exmas_revised(args.configuration)
+    for path, key in [(args.output, 'rides'), (args.schedule, 'schedule')]:
+        if path and key in results:
+            output = results[key]
+            if isinstance(output, RideReader):
+                output = output.to_dataframe()
+            if os.path.splitext(path)[1] == '.csv':
+                output.to_csv(path, index=False)
+            else:
+                output.to_parquet(path, index=False)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+""" Offline preparation of artifacts used by main.py (city graph, skim, snapped demand) """
+import argparse
+import os
+
+import utilities.preprocessing
+from utilities.general_utils import initialise_logger
+
+
+def prepare_artifacts(
+        configuration_path: str
+) -> dict:
+    """
+    Build (or verify) the artifacts of a run, so that the solver
+    only reads them: the city graph (downloaded with osmnx if missing),
+    the demand snapped to the graph (sidecar next to the demand file)
+    and the binary skim covering the demand
+    @param configuration_path: path to the .json configuration file
+    @return paths of the artifacts
+    """
+    configuration = utilities.preprocessing.load_configuration(path=configuration_path)
+    logger = initialise_logger(logger_level=configuration.get('logger_level', 'INFO'))
+
+    if not os.path.exists(configuration['paths']['city_graph']):
+        utilities.preprocessing.load_city_graph(configuration, logger)
+    demand = utilities.preprocessing.load_demand(
+        configuration['requests'], config=configuration, logger=logger)
+    if configuration.get('skim_mode') != 'lazy':
+        skim_matrix = utilities.preprocessing.load_skim(
+            config=configuration, logger=logger, demand=demand)
+        logger.info(f"Skim of {len(skim_matrix)} nodes ready")
+
+    return configuration['paths']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Prepare the city graph, skim and snapped demand for main.py")
+    parser.add_argument('configuration', nargs='?', default='configs/runs/run_nyc.json',
+                        help="path to the .json configuration file")
+    prepare_artifacts(parser.parse_args().configuration)
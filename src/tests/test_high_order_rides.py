@@ -0,0 +1,24 @@
+""" Extension of rides to higher degrees """
+from algorithm.attractive_rides import attractive_rides
+from tests.test_pairs import PARAMETERS, asymmetric_city, demand
+from utilities.metrics import Metrics
+
+
+def ride_keys(rides):
+    return sorted(zip(map(tuple, rides['origin_order']), map(tuple, rides['destination_order']),
+                      rides['u_traveller_total'].astype(float).round(6)))
+
+
+def test_bounds_reject_candidates_without_losing_rides():
+    skim = asymmetric_city()
+    requests = demand(skim, requests=80)
+    parameters = dict(PARAMETERS, max_degree=4)
+
+    metrics = Metrics()
+    bounded = attractive_rides(requests.copy(), skim, parameters, metrics=metrics)
+    exhaustive = attractive_rides(requests.copy(), skim, dict(parameters, spatial_landmarks=0))
+
+    assert ride_keys(bounded) == ride_keys(exhaustive)
+    for degree in [3, 4]:
+        counts = metrics.counts[f'degree_{degree}']
+        assert counts['attractive'] <= counts['bounds'] < counts['candidates']
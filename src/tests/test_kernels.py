@@ -0,0 +1,23 @@
+""" Equivalence of kernel backends """
+import pandas as pd
+import pytest
+
+from algorithm.attractive_rides import attractive_rides
+from algorithm.feasibility_utils.kernels import numba
+from benchmarks.kernels import kernel_differences
+from tests.test_pairs import PARAMETERS, asymmetric_city, demand
+
+BACKENDS = ['python', pytest.param('numba', marks=pytest.mark.skipif(numba is None, reason="Numba not installed"))]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_produce_identical_rides(backend):
+    skim = asymmetric_city()
+    requests = demand(skim, requests=80)
+    parameters = dict(PARAMETERS, max_degree=3)
+
+    reference = attractive_rides(requests.copy(), skim, dict(parameters, kernel_backend='numpy'))
+    rides = attractive_rides(requests.copy(), skim, dict(parameters, kernel_backend=backend))
+
+    assert kernel_differences('numpy', backend) == []
+    pd.testing.assert_frame_equal(rides, reference)
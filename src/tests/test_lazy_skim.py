@@ -0,0 +1,54 @@
+""" Skim computing rows on demand """
+import networkx as nx
+import numpy as np
+import pytest
+
+from utilities.lazy_skim import LazySkim
+
+
+def city_graph() -> nx.DiGraph:
+    """ One-way ring of four nodes and an isolated node """
+    graph = nx.DiGraph()
+    graph.add_weighted_edges_from([(10, 20, 100.), (20, 30, 150.), (30, 40, 200.), (40, 10, 250.)],
+                                  weight='length')
+    graph.add_node(50)
+    return graph
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'uint32'])
+def test_lookups_match_the_dense_subset(tmp_path, dtype):
+    skim = LazySkim(city_graph(), capacity=2, cache_dir=str(tmp_path), dtype=dtype)
+    origins, destinations = np.array([10, 30, 40, 10, 50]), np.array([40, 20, 30, 50, 10])
+
+    expected = np.array([450., 550., 500., np.inf, np.inf])
+    np.testing.assert_array_equal(skim[origins, destinations], expected)
+    dense = skim.subset([10, 20, 30, 40, 50])
+    np.testing.assert_array_equal(dense[origins, destinations], expected)
+    assert np.isinf(dense.to_dataframe().loc[50, 10])
+    assert skim.path_length([10, 30, 20]) == 250. + 550.
+
+
+def test_full_matrix_is_not_exposed():
+    skim = LazySkim(city_graph())
+    assert not hasattr(skim, 'matrix') and not hasattr(skim, 'to_dataframe')
+
+
+def test_rows_are_fetched_in_batches_of_capacity(monkeypatch):
+    graph = nx.DiGraph()
+    graph.add_weighted_edges_from([(node, (node + 1) % 20, 10.) for node in range(20)], weight='length')
+    skim = LazySkim(graph, capacity=3)
+    held = []
+    fetch = skim.rows
+
+    def counted_rows(positions):
+        rows = fetch(positions)
+        held.append(max(len(rows), len(skim._rows)))
+        return rows
+
+    monkeypatch.setattr(skim, 'rows', counted_rows)
+    origins = np.repeat(np.arange(20), 2)
+    destinations = np.tile([0, 5], 20)
+
+    np.testing.assert_array_equal(skim[origins, destinations], (destinations - origins) % 20 * 10.)
+    np.testing.assert_array_equal(skim.subset(np.arange(20)).matrix[7], (np.arange(20) - 7) % 20 * 10.)
+    assert len(held) == 2 * 7 and max(held) <= 3
@@ -0,0 +1,26 @@
+""" Matching of travellers to attractive rides """
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import shareability_output, shareability_rides
+from algorithm.matching import match_rides, schedule_travellers
+from tests.test_pairs import PARAMETERS, asymmetric_city, demand
+
+
+def test_greedy_schedule_covers_travellers_once():
+    skim = asymmetric_city()
+    requests = demand(skim, requests=200)
+    rides_by_degree = shareability_rides(requests, skim, dict(PARAMETERS, max_degree=3))
+
+    greedy = match_rides(rides_by_degree, method='greedy')
+    improved = match_rides(rides_by_degree, method='greedy', local_search_passes=5)
+    interrupted = match_rides(rides_by_degree, method='greedy', local_search_passes=5, time_limit=0)
+
+    for matching in [greedy, improved, interrupted]:
+        travellers = schedule_travellers(matching)['traveller_id']
+        assert travellers.is_unique and len(travellers) == len(rides_by_degree[1])
+        pd.testing.assert_frame_equal(
+            matching['schedule'],
+            shareability_output(rides_by_degree).iloc[matching['selected']].reset_index(drop=True))
+    assert improved['objective'] <= greedy['objective']
+    np.testing.assert_array_equal(interrupted['selected'], greedy['selected'])
@@ -0,0 +1,68 @@
+""" Travel times of attractive pairs """
+import numpy as np
+import pandas as pd
+
+from algorithm.attractive_rides import shareability_rides
+from algorithm.feasibility_utils.pooltype import PoolType
+from utilities.skim import Skim
+
+PARAMETERS = {'VoT': 0.0046, 'WtS': 1.0, 'delay_value': 1, 'speed': 6, 'share_discount': 0.5,
+              'price': 1.5, 'horizon': 1200, 'max_degree': 2}
+
+
+def asymmetric_city(
+        side: int = 8,
+        spacing: float = 250,
+        eastbound: float = 2.
+) -> Skim:
+    """ Grid with Manhattan distances, travelling east costs extra (a quasi-metric) """
+    xy = np.array([(x, y) for x in range(side) for y in range(side)]) * spacing
+    distance = np.abs(xy[:, None, :] - xy[None, :, :]).sum(axis=2) + \
+        eastbound * np.maximum(xy[None, :, 0] - xy[:, None, 0], 0)
+    return Skim(distance, np.arange(len(xy)) + 100)
+
+
+def demand(
+        skim: Skim,
+        requests: int = 150,
+        seed: int = 0
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    origins = rng.choice(skim.nodes, requests)
+    destinations = rng.choice(skim.nodes, requests)
+    keep = origins != destinations
+    times = pd.Timestamp('2024-01-01 08:00:00') + pd.to_timedelta(rng.integers(0, 900, requests), unit='s')
+    return pd.DataFrame({'origin': origins, 'destination': destinations,
+                         'request_time': times.strftime('%Y-%m-%d %H:%M:%S')})[keep].reset_index(drop=True)
+
+
+def test_pair_travel_times_follow_routes_in_asymmetric_skim():
+    skim = asymmetric_city()
+    requests = demand(skim)
+    pairs = shareability_rides(requests.copy(), skim, PARAMETERS)[2]
+
+    # Default traveller ids follow rows of the demand
+    origin = requests['origin'].to_numpy()[pairs.origin_order - 1]
+    destination = requests['destination'].to_numpy()[pairs.destination_order - 1]
+    route = np.hstack([origin, destination])
+    legs = np.trunc(skim[route[:, :-1], route[:, 1:]] / PARAMETERS['speed'])
+
+    assert {PoolType.FIFO2, PoolType.LIFO2} <= set(pairs.kind.tolist())
+    np.testing.assert_array_equal(pairs.t_travel, legs.sum(axis=1))
+    np.testing.assert_array_equal(pairs.veh_distance, legs.sum(axis=1) * PARAMETERS['speed'])
+
+
+def test_rides_with_unreachable_legs_are_excluded():
+    distance = np.array([[0., 300., 600., 900.],
+                         [300., 0., 300., 600.],
+                         [600., 300., 0., 300.],
+                         [900., 600., np.inf, 0.]])
+    skim = Skim(distance, np.array([1, 2, 3, 4]))
+    requests = pd.DataFrame({'origin': [1, 2], 'destination': [3, 4],
+                             'request_time': ['2024-01-01 08:00:00', '2024-01-01 08:00:30']})
+
+    pairs = shareability_rides(requests, skim, PARAMETERS)[2]
+
+    # LIFO (1, 2) ends with the unreachable leg 4 -> 3, FIFO does not use it
+    assert pairs.kind.tolist() == [PoolType.FIFO2]
+    np.testing.assert_array_equal(pairs.t_travel, [150])
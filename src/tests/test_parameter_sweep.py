@@ -0,0 +1,33 @@
+""" Attractive rides of many scenarios at once """
+import pytest
+
+from algorithm.attractive_rides import attractive_rides
+from algorithm.parameter_sweep import parameter_sweep
+from tests.test_pairs import PARAMETERS, asymmetric_city, demand
+
+SCENARIOS = [{'price': 1.5}, {'price': 2.5, 'WtS': 1.3}, {'VoT': 0.006, 'max_degree': 2}]
+
+
+def ride_keys(rides):
+    return sorted(zip(map(tuple, rides['origin_order']), map(tuple, rides['destination_order']),
+                      rides['u_traveller_total'].astype(float).round(6)))
+
+
+@pytest.mark.parametrize('dist_threshold', [600, 1500])
+def test_sweep_matches_separate_runs(dist_threshold):
+    skim = asymmetric_city()
+    requests = demand(skim, requests=200)
+    parameters = dict(PARAMETERS, max_degree=3, dist_threshold=dist_threshold)
+
+    swept = parameter_sweep(requests.copy(), skim, parameters, SCENARIOS)
+
+    for rides, scenario in zip(swept, SCENARIOS):
+        separate = attractive_rides(requests.copy(), skim, {**parameters, **scenario})
+        assert ride_keys(rides) == ride_keys(separate)
+
+
+@pytest.mark.parametrize('scenario', [{'dist_threshold': 600}, {'spatial_landmarks': 0}])
+def test_scenarios_cannot_change_geometry(scenario):
+    skim = asymmetric_city()
+    with pytest.raises(ValueError, match='dist_threshold'):
+        parameter_sweep(demand(skim), skim, dict(PARAMETERS, dist_threshold=1500), [scenario])
@@ -0,0 +1,30 @@
+""" On-disk cache of attractive rides """
+import os
+
+import numpy as np
+
+from algorithm.attractive_rides import shareability_rides
+from algorithm.result_cache import ResultCache
+from tests.test_pairs import PARAMETERS, asymmetric_city, demand
+
+
+def test_partial_files_are_rewritten(tmp_path):
+    skim = asymmetric_city()
+    rides_by_degree = shareability_rides(demand(skim, requests=60), skim, PARAMETERS)
+    cache = ResultCache(str(tmp_path))
+
+    # A file truncated by a crash and an intact one
+    cache.store_degree('key', 1, rides_by_degree[1])
+    intact = os.stat(tmp_path / 'key' / 'degree_1.parquet').st_mtime_ns
+    with open(tmp_path / 'key' / 'degree_2.parquet', 'wb') as file:
+        file.write(b'PAR1')
+
+    cache.store('key', rides_by_degree, max_degree=2)
+    cached, complete = cache.load('key', max_degree=2)
+
+    assert complete and sorted(cached) == [1, 2]
+    assert os.stat(tmp_path / 'key' / 'degree_1.parquet').st_mtime_ns == intact
+    for degree, rides in rides_by_degree.items():
+        np.testing.assert_array_equal(cached[degree].ids, rides.ids)
+        np.testing.assert_array_equal(cached[degree].veh_distance, rides.veh_distance)
+    assert not [name for name in os.listdir(tmp_path / 'key') if name.endswith('.tmp')]
@@ -0,0 +1,29 @@
+""" Compact binary skims """
+import numpy as np
+import pytest
+
+from utilities.skim import Skim
+from utilities.skim_store import load_skim_binary, save_skim
+
+
+def skim_with_unreachable() -> Skim:
+    distance = np.array([[0., 1200.4, np.inf],
+                         [1199.6, 0., 300.],
+                         [np.inf, 310., 0.]])
+    return Skim(distance, np.array([7, 8, 9]))
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'uint32', 'uint16'])
+def test_unreachable_pairs_survive_compact_storage(tmp_path, dtype):
+    path = str(tmp_path / 'skim.npy')
+    save_skim(skim_with_unreachable(), path, dtype)
+    skim = load_skim_binary(path)
+    assert skim.matrix.dtype == np.dtype(dtype)
+    assert np.allclose(skim[[7, 9, 8], [9, 7, 7]], [np.inf, np.inf, 1200.], atol=0.5)
+    assert np.isinf(skim.to_dataframe().loc[9, 7])
+
+
+def test_out_of_range_distances_are_rejected(tmp_path):
+    skim = Skim(np.array([[0., 70000.], [70000., 0.]]), np.array([1, 2]))
+    with pytest.raises(ValueError, match='uint16'):
+        save_skim(skim, str(tmp_path / 'skim.npy'), 'uint16')
@@ -4,7 +4,7 @@ import logging
 import os
 import sys
 
-import pandas as pd
+from utilities.skim import Skim
 
 
 def initialise_logger(
@@ -53,7 +53,7 @@ def create_folder(
 
 
 def calculate_distance(
-        skim: pd.DataFrame,
+        skim: Skim,
         list_points: list or tuple
 ) -> float or int:
     """
@@ -61,13 +61,4 @@ def calculate_distance(
     when going through multiple points
     """
     assert list_points, "Empty list of points"
-    if len(list_points) == 1:
-        return 0
-    out = 0
-    current_point = 0
-    next_point = 1
-    while next_point <= len(list_points):
-        out += skim.loc[list_points[current_point], list_points[next_point]]
-        current_point += 1
-        next_point += 1
-    return out
+    return skim.path_length(list_points)
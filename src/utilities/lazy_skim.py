@@ -0,0 +1,155 @@
+""" Skim computing shortest-path rows on demand, with LRU cache on disk """
+from collections import OrderedDict
+import os
+
+import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from utilities.skim import BaseSkim, Skim, widen_distances
+from utilities.skim_builder import graph_to_csr
+from utilities.skim_store import to_storage_dtype
+
+
+class LazySkim(BaseSkim):
+    """
+    Skim with the lookup interface of Skim, without the full matrix:
+    the rows (distances from an origin to all nodes) are computed on
+    first access. At most `capacity` rows are kept in memory (least
+    recently used are evicted), computed rows are persisted in
+    `cache_dir` and reused by later runs. Use subset for a dense Skim.
+    """
+
+    def __init__(
+            self,
+            city_graph: nx.Graph,
+            capacity: int = 1024,
+            cache_dir: str | None = None,
+            dtype: str = 'float64'
+    ):
+        """
+        :param city_graph: graph of the city, edges with 'length'
+        :param capacity: maximal number of rows kept in memory
+        :param cache_dir: folder where rows are persisted, None for no persistence
+        :param dtype: type in which rows are kept
+        """
+        self.adjacency, nodes = graph_to_csr(city_graph)
+        super().__init__(nodes)
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.dtype = np.dtype(dtype)
+        self._rows = OrderedDict()
+        self.statistics = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            index_path = os.path.join(cache_dir, 'nodes.npy')
+            if os.path.exists(index_path):
+                assert np.array_equal(np.load(index_path), self.nodes), \
+                    f"Rows in {cache_dir} were computed for a different graph"
+            else:
+                np.save(index_path, self.nodes)
+
+    def _row_path(
+            self,
+            position: int
+    ) -> str:
+        return os.path.join(self.cache_dir, f'{self.nodes[position]}.npy')
+
+    def _remember(
+            self,
+            position: int,
+            row: np.ndarray
+    ) -> None:
+        self._rows[position] = row
+        if len(self._rows) > self.capacity:
+            self._rows.popitem(last=False)
+            self.statistics['evictions'] += 1
+
+    def rows(
+            self,
+            positions: np.ndarray
+    ) -> dict:
+        """
+        Distance rows for the given row positions, computing missing ones.
+        At most capacity rows are requested at once, so that all of them
+        stay in the cache (see batches).
+        :param positions: unique positions of origins
+        :return: dictionary position -> row
+        """
+        assert len(positions) <= self.capacity, "Rows must be requested in batches of at most capacity"
+        out = {}
+        missing = []
+        for position in positions.tolist():
+            if position in self._rows:
+                self._rows.move_to_end(position)
+                out[position] = self._rows[position]
+                self.statistics['hits'] += 1
+            elif self.cache_dir is not None and os.path.exists(self._row_path(position)):
+                out[position] = np.load(self._row_path(position))
+                self._remember(position, out[position])
+                self.statistics['disk_hits'] += 1
+            else:
+                missing.append(position)
+
+        if missing:
+            self.statistics['misses'] += len(missing)
+            computed = to_storage_dtype(dijkstra(self.adjacency, directed=True, indices=missing), self.dtype)
+            for position, row in zip(missing, computed):
+                out[position] = row
+                self._remember(position, row)
+                if self.cache_dir is not None:
+                    np.save(self._row_path(position), row)
+
+        return out
+
+    def batches(
+            self,
+            positions: np.ndarray
+    ):
+        """
+        Iterate over rows in batches of at most capacity, so that the memory
+        is bounded by the cache rather than by the number of positions
+        :param positions: unique positions of origins
+        :return: generator of (offset of the batch in positions, rows of the batch)
+        """
+        for start in range(0, len(positions), self.capacity):
+            yield start, self.rows(positions[start:start + self.capacity])
+
+    def __getitem__(
+            self,
+            key: tuple
+    ):
+        """ Distance between origin(s) and destination(s), vectorized """
+        origins, destinations = key
+        origins, destinations = np.broadcast_arrays(self.positions(origins),
+                                                    self.positions(destinations))
+        unique, inverse = np.unique(origins, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+        flat_destinations = destinations.reshape(-1)
+        out = np.empty(len(inverse), dtype=np.float64)
+        # Only the needed columns are gathered before the next batch of rows
+        for start, rows in self.batches(unique):
+            for num, position in enumerate(unique[start:start + len(rows)].tolist(), start):
+                selected = order[bounds[num]:bounds[num + 1]]
+                out[selected] = widen_distances(rows[position][flat_destinations[selected]])
+        return out.reshape(origins.shape)[()]
+
+    def subset(
+            self,
+            nodes: np.ndarray or list
+    ) -> Skim:
+        """ Dense skim restricted to the given nodes (e.g. demand nodes) """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        pos = self.positions(nodes)
+        matrix = np.empty((len(pos), len(pos)), dtype=self.dtype)
+        for start, rows in self.batches(pos):
+            for num, position in enumerate(pos[start:start + len(rows)].tolist(), start):
+                matrix[num] = rows[position][pos]
+        return Skim(matrix, nodes)
+
+    def cache_info(self) -> dict:
+        """ Hit/miss statistics and current size of the cache """
+        return dict(self.statistics, size=len(self._rows), capacity=self.capacity)
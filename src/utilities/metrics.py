@@ -0,0 +1,120 @@
+""" Per-stage timings, candidate counts and optional profiles of a run """
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from logging import Logger
+
+from utilities.general_utils import optional_log
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_memory() -> int | None:
+    """ Peak resident set size of the process in bytes """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Metrics:
+    """
+    Collects, for consecutive stages of the algorithm, wall and CPU time,
+    peak memory and the number of candidates surviving each filter.
+    Repeated stages (e.g. windows of the rolling horizon) are accumulated.
+    """
+
+    def __init__(
+            self,
+            profile: bool = False,
+            profile_lines: int = 25
+    ):
+        """
+        :param profile: run cProfile around each stage
+        :param profile_lines: number of functions reported per profiled stage
+        """
+        self.profile = profile
+        self.profile_lines = profile_lines
+        self.stages = {}
+        self.counts = {}
+        self._profiles = {}
+        self._profiling = False
+
+    @contextmanager
+    def stage(
+            self,
+            name: str
+    ):
+        """ Measure the enclosed block as the stage 'name' """
+        profiler = None
+        if self.profile and not self._profiling:
+            profiler = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profiler.enable()
+        wall, cpu, peak = time.perf_counter(), time.process_time(), peak_memory()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            record = self.stages.setdefault(name, {'wall': 0., 'cpu': 0., 'calls': 0,
+                                                   'peak_rss': None, 'peak_rss_increase': 0})
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['calls'] += 1
+            if peak is not None:
+                record['peak_rss'] = peak_memory()
+                record['peak_rss_increase'] += record['peak_rss'] - peak
+
+    def count(
+            self,
+            stage: str,
+            name: str,
+            value: int,
+            logger: Logger | None = None
+    ) -> None:
+        """ Record the number of candidates left after the filter 'name' """
+        counts = self.counts.setdefault(stage, {})
+        counts[name] = counts.get(name, 0) + int(value)
+        optional_log(10, f"{stage}: {value} candidates after {name}", logger)
+
+    def merge_counts(
+            self,
+            counts: dict
+    ) -> None:
+        """ Add counts collected elsewhere (e.g. in a worker process) """
+        for stage, values in counts.items():
+            for name, value in values.items():
+                self.count(stage, name, value)
+
+    def profiles(self) -> dict:
+        """ Top functions (by cumulative time) of each profiled stage """
+        reports = {}
+        for name, profiler in self._profiles.items():
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(
+                self.profile_lines)
+            reports[name] = stream.getvalue()
+        return reports
+
+    def to_dict(self) -> dict:
+        output = {'stages': self.stages, 'counts': self.counts}
+        if self.profile:
+            output['profiles'] = self.profiles()
+        return output
+
+    def dump(
+            self,
+            path: str
+    ) -> None:
+        """ Save the metrics to a .json file """
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
@@ -2,13 +2,17 @@
 
 from logging import Logger
 import json
+import os
 
+import numpy as np
 import pandas as pd
-import osmnx as ox
-import networkx as nx
-import pyarrow
 
-from src.utilities.general_utils import optional_log
+from utilities.general_utils import optional_log
+from utilities.skim import BaseSkim, Skim
+from utilities.skim_store import load_skim_binary, save_skim, demand_nodes
+
+# Graph and geospatial dependencies (networkx, scipy, osmnx) are imported
+# only when artifacts (graph, skim, snapped demand) have to be prepared
 
 
 def load_configuration(
@@ -36,50 +40,93 @@ def load_configuration(
     return config
 
 
-def load_skim(
+def load_city_graph(
         config: dict,
         logger: Logger
-) -> pd.DataFrame:
+):
     """
-    Load data necessarily for distance and paths calculations
+    Read the city graph, download it with osmnx if missing
     :param config: configuration of the city
     :param logger: for logging purposes
-    :return: skim - dictionary with way of calculation and data
+    :return: city graph (networkx.MultiDiGraph)
     """
+    import networkx as nx
+
     try:
-        skim_matrix = pd.read_parquet(config['paths']['skim_matrix'])
+        city_graph = nx.read_graphml(config['paths']['city_graph'])
+        # city_graph = pickle.load(open(config['paths']['city_graph'], 'rb'))
     except FileNotFoundError:
-        missing_skim = True
-        skim_matrix = None
+        logger.warning("City graph missing, using osmnx")
+        logger.warning(f"Writing the city graph to {config['paths']['city_graph']}")
+        import osmnx as ox
+        city_graph = ox.graph_from_place(config['city'], network_type='drive')
+        ox.save_graphml(city_graph, config['paths']['city_graph'])
+        # pickle.dump(city_graph, open(config['paths']['city_graph'], 'wb'))
     else:
-        missing_skim = False
+        logger.warning("Successfully read city graph")
+    return city_graph
 
-    if missing_skim:
+
+def load_skim(
+        config: dict,
+        logger: Logger,
+        demand: pd.DataFrame | None = None
+) -> BaseSkim:
+    """
+    Load data necessarily for distance and paths calculations
+    :param config: configuration of the city
+    :param logger: for logging purposes
+    :param demand: if passed, a missing skim is computed only
+    between origins and destinations of the requests
+    :return: skim - array-backed distance matrix indexed by node ids
+    (LazySkim computing rows on demand with skim_mode 'lazy')
+    """
+    if config.get('skim_mode') == 'lazy':
+        from utilities.lazy_skim import LazySkim
+        return LazySkim(
+            city_graph=load_city_graph(config, logger),
+            capacity=config.get('skim_cache_rows', 1024),
+            cache_dir=config['paths'].get('skim_rows')
+        )
+
+    binary_path = config['paths'].get(
+        'skim_binary', os.path.splitext(config['paths']['skim_matrix'])[0] + '.npy')
+    required_nodes = None if demand is None else demand_nodes(demand)
+
+    if os.path.exists(binary_path):
+        skim = load_skim_binary(binary_path)
+        if required_nodes is None or np.isin(required_nodes, skim.nodes).all():
+            logger.warning("Successfully mapped binary skim matrix")
+            return skim
+        logger.warning("Binary skim matrix does not cover the demand, extending...")
+        required_nodes = np.union1d(required_nodes, skim.nodes)
+        del skim
+    else:
         try:
-            city_graph = nx.read_graphml(config['paths']['city_graph'])
-            # city_graph = pickle.load(open(config['paths']['city_graph'], 'rb'))
+            skim_matrix = pd.read_parquet(config['paths']['skim_matrix'])
         except FileNotFoundError:
-            logger.warning("City graph missing, using osmnx")
-            logger.warning(f"Writing the city graph to {config['paths']['city_graph']}")
-            city_graph = ox.graph_from_place(config['city'], network_type='drive')
-            ox.save_graphml(city_graph, config['paths']['city_graph'])
-            # pickle.dump(city_graph, open(config['paths']['city_graph'], 'wb'))
+            pass
         else:
-            logger.warning("Successfully read city graph")
-        logger.warning("Skim matrix missing, calculating...")
-        skim_matrix = pd.DataFrame(dict(
-            nx.all_pairs_dijkstra_path_length(city_graph, weight='length')))
-        skim_matrix.columns = [str(col) for col in skim_matrix.columns]
-
-        logger.warning(f"Writing the skim matrix to {config['paths']['skim_matrix']}")
-        skim_matrix.to_parquet(config['paths']['skim_matrix'], compression='brotli')
-        config['paths']['skim_matrix'] = config['paths']['skim_matrix']
-    else:
-        logger.warning("Successfully read skim matrix")
-
-    skim_matrix.columns = [int(t) for t in skim_matrix.columns]
-
-    return skim_matrix
+            logger.warning("Successfully read skim matrix")
+            skim_matrix.index = [int(t) for t in skim_matrix.index]
+            skim = Skim.from_dataframe(skim_matrix)
+            if required_nodes is None or np.isin(required_nodes, skim.nodes).all():
+                save_skim(skim, binary_path, config.get('skim_dtype', 'float64'), logger)
+                return load_skim_binary(binary_path)
+            logger.warning("Skim matrix does not cover the demand, recomputing...")
+            required_nodes = np.union1d(required_nodes, skim.nodes)
+
+    logger.warning("Skim matrix missing, calculating...")
+
+    from utilities.skim_builder import build_skim
+    return build_skim(
+        city_graph=load_city_graph(config, logger),
+        path=binary_path,
+        nodes=required_nodes,
+        dtype=config.get('skim_dtype', 'float64'),
+        processes=config.get('skim_processes'),
+        logger=logger
+    )
 
 
 def load_demand(
@@ -89,11 +136,10 @@ def load_demand(
 ) -> pd.DataFrame:
     """ Function dedicated to loading requests """
     df = False
-    ext_type_n = None
-    for ext_type_n, ext_func in enumerate([pd.read_csv, pd.read_excel, pd.read_parquet]):
+    for ext_func in [pd.read_csv, pd.read_excel, pd.read_parquet]:
         try:
             df = ext_func(path)
-        except FileNotFoundError or pyarrow.lib.ArrowInvalid:
+        except FileNotFoundError:
             pass
         else:
             break
@@ -101,23 +147,15 @@ def load_demand(
     optional_log(30, "Demand read", logger)
 
     if all(col_name in df.columns for col_name in
-            ['origin_long', 'origin_y', 'destination_long', 'destination_y'])\
+            ['origin_long', 'origin_lat', 'destination_long', 'destination_lat'])\
             and not all(col_name in df.columns for col_name in ['origin', 'destination']):
-        optional_log(30, "Demand structured with non-osmnx, writing new columns..", logger)
-        city_graph = nx.read_graphml(config['paths']['city_graph'])
-        for org_dest in ['origin', 'destination']:
-            df[org_dest] = df.apply(
-                lambda row: ox.nearest_nodes(city_graph, row[org_dest+'_long'], row[org_dest+'_lat']),
-                axis=1
-            )
-            df[org_dest] = df.apply(lambda row: row[0] if isinstance(row, list) else int(row), axis=1)
-        if ext_type_n == 0:
-            df.to_csv(path)
-        elif ext_type_n == 1:
-            df.to_excel(path)
-        elif ext_type_n == 2:
-            df.to_parquet(path)
-        else:
-            raise SystemExit("Incorrect format")
+        optional_log(30, "Demand structured with non-osmnx, snapping to the graph..", logger)
+        from utilities.snapping import snap_demand
+        df = snap_demand(
+            requests=df,
+            demand_path=path,
+            graph_path=config['paths']['city_graph'],
+            logger=logger
+        )
 
     return df
@@ -0,0 +1,59 @@
+""" NumPy arrays shared between processes without pickling """
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Copies arrays into shared memory blocks once; other processes attach
+    to them by name (see attach_shared_arrays) instead of receiving copies.
+    Use as a context manager, blocks are released on exit.
+    """
+
+    def __init__(
+            self,
+            arrays: dict
+    ):
+        """
+        :param arrays: name -> numeric NumPy array
+        """
+        self._blocks = []
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            assert array.dtype != object, f"Array {name} is not numeric"
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def attach_shared_arrays(
+        specs: dict
+) -> (dict, list):
+    """
+    Attach to arrays created by SharedArrays in another process
+    :param specs: SharedArrays.specs
+    :return: name -> array, and the blocks which must be kept alive
+    as long as the arrays are used
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in specs.items():
+        block = SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
@@ -0,0 +1,136 @@
+""" Array-backed skim (distance) matrix with a node-id index """
+import numpy as np
+import pandas as pd
+
+
+def unreachable_value(
+        dtype: np.dtype
+) -> int:
+    """ Value marking unreachable pairs in skims stored as integers """
+    return np.iinfo(dtype).max
+
+
+def widen_distances(
+        values: np.ndarray
+) -> np.ndarray:
+    """
+    Distances as floats: compact (integer) storage is widened
+    to avoid unsigned arithmetic, unreachable pairs become inf
+    """
+    if values.dtype.kind == 'f':
+        return values
+    out = values.astype(np.float64)
+    out[values == unreachable_value(values.dtype)] = np.inf
+    return out
+
+
+class BaseSkim:
+    """
+    Node index and lookup interface common to skims: node ids are
+    translated to row/column positions with a precomputed sorted index.
+    Subclasses implement bulk lookups skim[origins, destinations] and
+    subset (a dense Skim restricted to the given nodes).
+    """
+
+    def __init__(
+            self,
+            nodes: np.ndarray or list
+    ):
+        """ :param nodes: node ids in order of rows/columns """
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self._order = np.argsort(self.nodes, kind='stable')
+        self._sorted_nodes = self.nodes[self._order]
+        # Identity of the source (e.g. file), used to key cached results
+        self.identity = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        pos = np.searchsorted(self._sorted_nodes, node)
+        return pos < len(self._sorted_nodes) and self._sorted_nodes[pos] == node
+
+    def positions(
+            self,
+            nodes: np.ndarray or list or int
+    ) -> np.ndarray or int:
+        """
+        Translate node ids into row/column positions
+        :param nodes: single node id or an array of node ids
+        :return: positions in the matrix (same shape as nodes)
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_nodes, nodes)
+        pos = np.minimum(pos, len(self._sorted_nodes) - 1)
+        if not np.all(self._sorted_nodes[pos] == nodes):
+            missing = np.atleast_1d(nodes)[np.atleast_1d(self._sorted_nodes[pos] != nodes)]
+            raise KeyError(f"Nodes not in the skim: {missing[:10].tolist()}")
+        return self._order[pos]
+
+    def path_length(
+            self,
+            points: np.ndarray or list or tuple
+    ) -> float or int:
+        """ Distance when going through consecutive points """
+        points = np.asarray(points, dtype=np.int64)
+        if len(points) < 2:
+            return 0
+        return self[points[:-1], points[1:]].sum()
+
+
+class Skim(BaseSkim):
+    """
+    Dense all-pairs distance matrix indexed by OSM node ids.
+    Distances are stored in a contiguous NumPy matrix, node ids
+    are translated to row/column positions with a precomputed
+    sorted index, so that lookups can be done in bulk:
+    skim[origins, destinations] -> array of distances
+    """
+
+    def __init__(
+            self,
+            matrix: np.ndarray,
+            nodes: np.ndarray or list
+    ):
+        """
+        :param matrix: square matrix of distances, row and column
+        positions correspond to the nodes
+        :param nodes: node ids in order of rows/columns
+        """
+        super().__init__(nodes)
+        self.matrix = np.ascontiguousarray(matrix)
+        assert self.matrix.shape == (len(self.nodes), len(self.nodes)), \
+            "Skim matrix must be square and match the node index"
+
+    @classmethod
+    def from_dataframe(
+            cls,
+            skim_matrix: pd.DataFrame
+    ):
+        """ Build skim from a dataframe with node ids as index and columns """
+        nodes = np.asarray(skim_matrix.index, dtype=np.int64)
+        columns = np.asarray([int(t) for t in skim_matrix.columns], dtype=np.int64)
+        if not np.array_equal(nodes, columns):
+            skim_matrix = skim_matrix.set_axis(columns, axis=1).loc[:, nodes]
+        return cls(skim_matrix.to_numpy(), nodes)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ Convert to a label-indexed dataframe """
+        return pd.DataFrame(widen_distances(np.asarray(self.matrix)), index=self.nodes, columns=self.nodes)
+
+    def __getitem__(
+            self,
+            key: tuple
+    ):
+        """ Distance between origin(s) and destination(s), vectorized """
+        origins, destinations = key
+        return widen_distances(self.matrix[self.positions(origins), self.positions(destinations)])
+
+    def subset(
+            self,
+            nodes: np.ndarray or list
+    ):
+        """ Restrict the skim to the given nodes (e.g. demand nodes) """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        pos = self.positions(nodes)
+        return Skim(np.asarray(self.matrix)[np.ix_(pos, pos)], nodes)
@@ -0,0 +1,117 @@
+""" Computation of the skim matrix restricted to the demand nodes """
+from concurrent.futures import ProcessPoolExecutor
+from logging import Logger
+import os
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from utilities.general_utils import optional_log
+from utilities.skim import Skim
+from utilities.skim_store import create_skim_store, to_storage_dtype, load_skim_binary
+
+_WORKER_GRAPH = {}
+
+
+def graph_to_csr(
+        city_graph: nx.Graph,
+        weight: str = 'length'
+) -> (csr_matrix, np.ndarray):
+    """
+    Convert the city graph into a sparse adjacency matrix.
+    For parallel edges (MultiDiGraph from osmnx) the shortest is kept.
+    :param city_graph: graph of the city
+    :param weight: edge attribute with the length
+    :return: csr adjacency and node ids in order of rows
+    """
+    nodes = np.array([int(t) for t in city_graph.nodes], dtype=np.int64)
+    position = {node: num for num, node in enumerate(city_graph.nodes)}
+    edges = [(position[u], position[v], float(w)) for u, v, w in
+             city_graph.edges(data=weight, default=np.inf)]
+    if not edges:
+        return csr_matrix((len(nodes), len(nodes))), nodes
+    rows, cols, lengths = (np.array(t) for t in zip(*edges))
+
+    # Keep the shortest of the parallel edges
+    order = np.lexsort((lengths, cols, rows))
+    rows, cols, lengths = rows[order], cols[order], lengths[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+
+    adjacency = csr_matrix((lengths[first], (rows[first], cols[first])),
+                           shape=(len(nodes), len(nodes)))
+    return adjacency, nodes
+
+
+def _initialise_worker(
+        adjacency: csr_matrix,
+        targets: np.ndarray
+) -> None:
+    """ Keep the graph in the worker, so it is sent only once """
+    _WORKER_GRAPH['adjacency'] = adjacency
+    _WORKER_GRAPH['targets'] = targets
+
+
+def _shortest_rows(
+        sources: np.ndarray
+) -> np.ndarray:
+    """ Single-source shortest paths for a batch of sources """
+    distances = dijkstra(_WORKER_GRAPH['adjacency'], directed=True, indices=sources)
+    return distances[:, _WORKER_GRAPH['targets']]
+
+
+def build_skim(
+        city_graph: nx.Graph,
+        path: str,
+        nodes: np.ndarray or None = None,
+        dtype: str = 'float64',
+        processes: int or None = None,
+        batch_size: int = 64,
+        logger: Logger | None = None
+) -> Skim:
+    """
+    Compute shortest path distances between the selected nodes and stream
+    them into the binary skim store. Sources are processed in batches
+    by a pool of processes.
+    :param city_graph: graph of the city, edges with 'length'
+    :param path: path to the .npy matrix file
+    :param nodes: nodes to be included (e.g. demand_nodes); all nodes if None
+    :param dtype: storage type of the skim
+    :param processes: number of processes, defaults to number of cores
+    :param batch_size: number of sources per task
+    :param logger: for logging purposes
+    :return: memory-mapped skim
+    """
+    adjacency, graph_nodes = graph_to_csr(city_graph)
+    skim_nodes = graph_nodes if nodes is None else np.unique(np.asarray(nodes, dtype=np.int64))
+
+    order = np.argsort(graph_nodes)
+    found = np.minimum(np.searchsorted(graph_nodes[order], skim_nodes), len(graph_nodes) - 1)
+    assert np.array_equal(graph_nodes[order][found], skim_nodes), \
+        "Some of the requested nodes are not in the city graph"
+    positions = order[found]
+
+    store = create_skim_store(path, skim_nodes, dtype)
+    batches = [np.arange(start, min(start + batch_size, len(skim_nodes)))
+               for start in range(0, len(skim_nodes), batch_size)]
+    processes = processes or os.cpu_count()
+
+    optional_log(30, f"Computing skim for {len(skim_nodes)} nodes "
+                     f"using {processes} processes", logger)
+
+    if processes == 1:
+        _initialise_worker(adjacency, positions)
+        for batch in batches:
+            store[batch] = to_storage_dtype(_shortest_rows(positions[batch]), store.dtype)
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_initialise_worker,
+                                 initargs=(adjacency, positions)) as executor:
+            results = executor.map(_shortest_rows, [positions[batch] for batch in batches])
+            for batch, rows in zip(batches, results):
+                store[batch] = to_storage_dtype(rows, store.dtype)
+
+    store.flush()
+    optional_log(30, f"Skim matrix written to {path}", logger)
+    return load_skim_binary(path)
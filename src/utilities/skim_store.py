@@ -0,0 +1,142 @@
+""" Binary, memory-mappable storage of the skim matrix """
+from logging import Logger
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilities.general_utils import optional_log
+from utilities.skim import Skim, unreachable_value
+
+COMPACT_DTYPES = {
+    'float64': np.float64,
+    'float32': np.float32,
+    'uint32': np.uint32,
+    'uint16': np.uint16
+}
+
+
+def nodes_path(
+        path: str
+) -> str:
+    """ Path of the sidecar file with the node index """
+    return os.path.splitext(path)[0] + '.nodes.npy'
+
+
+def demand_nodes(
+        requests: pd.DataFrame
+) -> np.ndarray:
+    """ Unique nodes used as origins or destinations """
+    return np.unique(np.concatenate([requests['origin'].to_numpy(),
+                                     requests['destination'].to_numpy()]).astype(np.int64))
+
+
+def create_skim_store(
+        path: str,
+        nodes: np.ndarray or list,
+        dtype: str = 'float64'
+) -> np.memmap:
+    """
+    Create an (uninitialised) on-disk skim which may be filled row by row
+    :param path: path to the .npy matrix file
+    :param nodes: node ids in order of rows/columns
+    :param dtype: storage type, one of COMPACT_DTYPES
+    :return: writable memory-mapped matrix
+    """
+    if dtype not in COMPACT_DTYPES:
+        raise ValueError(f"dtype must be one of {list(COMPACT_DTYPES)}")
+    nodes = np.asarray(nodes, dtype=np.int64)
+    np.save(nodes_path(path), nodes)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=COMPACT_DTYPES[dtype],
+                                     shape=(len(nodes), len(nodes)))
+
+
+def to_storage_dtype(
+        rows: np.ndarray,
+        dtype: np.dtype
+) -> np.ndarray:
+    """
+    Round (for integer types) and check the range before storing.
+    In integer types unreachable pairs (inf) are stored as the maximal
+    value of the type, read back as inf (see widen_distances).
+    """
+    if np.issubdtype(dtype, np.integer):
+        rows = np.rint(rows)
+        if np.isnan(rows).any():
+            raise ValueError("Skim contains NaN distances")
+        unreachable = np.isposinf(rows)
+        if rows[~unreachable].max(initial=0) >= unreachable_value(dtype):
+            raise ValueError(f"Distances exceed the range of {np.dtype(dtype).name}, "
+                             f"use a wider skim_dtype")
+        rows = np.where(unreachable, unreachable_value(dtype), rows)
+    return rows.astype(dtype)
+
+
+def save_skim(
+        skim: Skim,
+        path: str,
+        dtype: str = 'float64',
+        logger: Logger | None = None
+) -> None:
+    """
+    Write the skim as an uncompressed fixed-dtype matrix with a node index
+    :param skim: skim to be stored
+    :param path: path to the .npy matrix file
+    :param dtype: storage type, compact integer types (uint32 metres,
+    uint16 for distances up to 65 km) reduce size two to four times
+    :param logger: for logging purposes
+    """
+    store = create_skim_store(path, skim.nodes, dtype)
+    chunk = max(1, 2 ** 24 // max(len(skim), 1))
+    for row in range(0, len(skim), chunk):
+        store[row:row + chunk] = to_storage_dtype(
+            np.asarray(skim.matrix[row:row + chunk]), store.dtype)
+    store.flush()
+    optional_log(30, f"Skim matrix written to {path} ({dtype})", logger)
+
+
+def load_skim_binary(
+        path: str,
+        mmap: bool = True
+) -> Skim:
+    """
+    Load the binary skim. With mmap, the matrix is not read into memory,
+    pages are loaded on access and shared between processes on one host.
+    :param path: path to the .npy matrix file
+    :param mmap: memory-map instead of reading
+    :return: skim
+    """
+    matrix = np.load(path, mmap_mode='r' if mmap else None)
+    nodes = np.load(nodes_path(path))
+    skim = Skim(matrix, nodes)
+    skim.identity = file_identity(path)
+    return skim
+
+
+def file_identity(
+        path: str
+) -> str:
+    """ Path, size and modification time of a file """
+    status = os.stat(path)
+    return f'{os.path.abspath(path)}:{status.st_size}:{status.st_mtime_ns}'
+
+
+def convert_parquet_skim(
+        parquet_path: str,
+        path: str,
+        dtype: str = 'float64',
+        logger: Logger | None = None
+) -> Skim:
+    """
+    One-time conversion of a parquet skim (node ids as columns)
+    into the binary format
+    :param parquet_path: existing parquet skim
+    :param path: path to the new .npy matrix file
+    :param dtype: storage type
+    :param logger: for logging purposes
+    :return: memory-mapped skim
+    """
+    skim_matrix = pd.read_parquet(parquet_path)
+    skim_matrix.index = [int(t) for t in skim_matrix.index]
+    save_skim(Skim.from_dataframe(skim_matrix), path, dtype, logger)
+    return load_skim_binary(path)
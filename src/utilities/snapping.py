@@ -0,0 +1,150 @@
+""" Snapping of demand coordinates to the nodes of the city graph """
+from logging import Logger
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilities.general_utils import optional_log
+
+EARTH_RADIUS = 6371000
+
+
+def index_path(
+        graph_path: str
+) -> str:
+    """ Path of the cached node coordinates next to the graph """
+    return os.path.splitext(graph_path)[0] + '.nodes_xy.npz'
+
+
+def sidecar_path(
+        demand_path: str
+) -> str:
+    """ Path of the cached snapped nodes next to the demand file """
+    return os.path.splitext(demand_path)[0] + '.snapped.npz'
+
+
+def _is_fresh(
+        cache: str,
+        source: str
+) -> bool:
+    return os.path.exists(cache) and \
+        (not os.path.exists(source) or os.path.getmtime(cache) >= os.path.getmtime(source))
+
+
+def project(
+        longitude: np.ndarray,
+        latitude: np.ndarray,
+        reference_latitude: float
+) -> np.ndarray:
+    """ Equirectangular projection to metres, accurate on the city scale """
+    longitude = np.radians(np.asarray(longitude, dtype=float))
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    return EARTH_RADIUS * np.column_stack(
+        [longitude * np.cos(np.radians(reference_latitude)), latitude])
+
+
+class NodeIndex:
+    """ KD-tree over projected coordinates of the graph nodes """
+
+    def __init__(
+            self,
+            nodes: np.ndarray,
+            longitude: np.ndarray,
+            latitude: np.ndarray
+    ):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.reference_latitude = float(np.mean(self.latitude)) if len(self.latitude) else 0.
+        from scipy.spatial import cKDTree
+        self.tree = cKDTree(project(self.longitude, self.latitude, self.reference_latitude))
+
+    @classmethod
+    def from_graph(
+            cls,
+            city_graph
+    ):
+        """ Read node coordinates ('x' - longitude, 'y' - latitude) of a networkx graph """
+        nodes, longitude, latitude = zip(*((int(node), float(data['x']), float(data['y']))
+                                           for node, data in city_graph.nodes(data=True)))
+        return cls(np.array(nodes), np.array(longitude), np.array(latitude))
+
+    def save(
+            self,
+            path: str
+    ) -> None:
+        np.savez(path, nodes=self.nodes, longitude=self.longitude, latitude=self.latitude)
+
+    @classmethod
+    def load(
+            cls,
+            path: str
+    ):
+        data = np.load(path)
+        return cls(data['nodes'], data['longitude'], data['latitude'])
+
+    def nearest(
+            self,
+            longitude: np.ndarray,
+            latitude: np.ndarray
+    ) -> np.ndarray:
+        """ Nearest nodes for arrays of coordinates, in a single query """
+        _, positions = self.tree.query(project(longitude, latitude, self.reference_latitude))
+        return self.nodes[positions]
+
+
+def load_node_index(
+        graph_path: str,
+        logger: Logger | None = None
+) -> NodeIndex:
+    """
+    Node index of the graph, built once and cached next to the graph
+    :param graph_path: path to the .graphml file
+    :param logger: for logging purposes
+    :return: node index
+    """
+    cache = index_path(graph_path)
+    if _is_fresh(cache, graph_path):
+        return NodeIndex.load(cache)
+
+    optional_log(30, f"Building node index of {graph_path}", logger)
+    import networkx as nx
+    node_index = NodeIndex.from_graph(nx.read_graphml(graph_path))
+    node_index.save(cache)
+    return node_index
+
+
+def snap_demand(
+        requests: pd.DataFrame,
+        demand_path: str,
+        graph_path: str,
+        logger: Logger | None = None
+) -> pd.DataFrame:
+    """
+    Assign origin and destination nodes to requests given with coordinates
+    (origin_long, origin_lat, destination_long, destination_lat).
+    The snapped nodes are cached in a sidecar file next to the demand,
+    the demand file itself is not modified.
+    :param requests: demand with coordinates
+    :param demand_path: path of the demand file (for the cache)
+    :param graph_path: path to the .graphml file
+    :param logger: for logging purposes
+    :return: requests with origin and destination columns
+    """
+    cache = sidecar_path(demand_path)
+    if _is_fresh(cache, demand_path) and _is_fresh(cache, graph_path):
+        snapped = np.load(cache)
+        if len(snapped['origin']) == len(requests):
+            optional_log(30, f"Snapped nodes read from {cache}", logger)
+            return requests.assign(origin=snapped['origin'], destination=snapped['destination'])
+
+    node_index = load_node_index(graph_path, logger)
+    snapped = {
+        org_dest: node_index.nearest(requests[org_dest + '_long'].to_numpy(),
+                                     requests[org_dest + '_lat'].to_numpy())
+        for org_dest in ['origin', 'destination']
+    }
+    np.savez(cache, **snapped)
+    optional_log(30, f"Snapped nodes written to {cache}", logger)
+    return requests.assign(**snapped)